@@ -5,27 +5,44 @@
 from model import *
 from player import Player
 import sys
-import random
-from copy import copy, deepcopy
-from cardmodels import Card
-from time import sleep
+from cardmodels import Card, RANK_SHIFT
+from collections import OrderedDict
+import itertools
+import multiprocessing
+import json
+import threading
+import time
+import os
 import logging
 
 log = logging.getLogger("snm.agent")
 
+# Log each node the search visits. The checks are only made when this is set,
+# so the search pays nothing for the tracing, even with the log at DEBUG.
+TRACE = bool(os.environ.get('SNM_TRACE'))
+
 
 class StateNode(object):
 	" A node in the search that represents a current state of the board "
 	SELF = "self"
 	OTHER = "other"
 
-	def __init__(self, state, action=None, parent_node=None, player="self"):
+	def __init__(self, state, action=None, parent_node=None, player="self", swap_player=False):
 		self.state = state
 		self.action = action
 		self.parent_node = parent_node
 		self.child_nodes = []
-		self.util_value = 0
+		# None until it has been calculated, the starting node has none
+		self.util_value = None
+		if not parent_node:
+			self.util_value = 0
 		self.player = player
+		# action is made after swapping the active player of the state
+		self.swap_player = swap_player
+		# number of moves from the starting state
+		self.depth = 0
+		if parent_node:
+			self.depth = parent_node.depth + 1
 
 	def __eq__(self, other):
 		" Override equality so that we can remove duplicate states. "
@@ -39,8 +56,169 @@ class StateNode(object):
 		return not self.__eq__(other)
 
 	def __str__(self):
-		return "Node[%d](p:%s|%s,%s,childs:%d)" % (
-				self.util_value, self.player, self.action, self.state, len(self.child_nodes))
+		return "Node[%d](p:%s|%s,%s,depth:%d)" % (
+				self.util_value, self.player, self.action, self.state, self.depth)
+
+
+class Weights(object):
+	"""
+	The points for each kind of move, used to calculate the utility value of a
+	node. Any of them can be changed by passing them as keyword arguments.
+	"""
+	# FIXME: Balance points so that placing on center only when necesarry (discard full, or no closer to po for op)
+
+	# to discard pile
+	discard = 10
+	discard_on_same = 50			# Discard on same value card
+	discard_on_empty = 30			# Discard on empty pile
+	discard_common_in_hand = 10		# Each time the discard card occures in the hard
+	discard_least_essential = 5		# Discard least essential card
+	discard_bury_least = 2			# Discard buries the least essential card
+	# to center
+	center = 0
+	center_pay_off = 1000			# Play the pay off card
+	# from hand
+	hand = 0
+	hand_empty = 120				# Empty hand without a discard
+	# All moves
+	op_dist_po = 30					# Each point away the closest center is from opponents pay off (max *12)
+	# Opponent play
+	other = 0
+	other_from_discard = -10		# Opponent plays from discard
+	other_from_pay_off = -1000		# Opponent plays pay_off card
+
+	def __init__(self, **weights):
+		for name, value in weights.items():
+			if not hasattr(Weights, name):
+				raise TypeError("Unknown weight %s" % name)
+			setattr(self, name, value)
+
+
+class SearchStopped(Exception):
+	" Raised in a search that was stopped before it finished "
+	pass
+
+
+class TranspositionTable(object):
+	"""
+	A size bounded cache of search results, keyed by state. When it is full the
+	least recently used entry is replaced. Counts hits and misses so the savings
+	can be measured.
+	"""
+
+	def __init__(self, size=100000):
+		self.size = size
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		" Return the entry stored for key, or None if there is none "
+		try:
+			entry = self.entries.pop(key)
+		except KeyError:
+			self.misses += 1
+			return None
+		# re-insert to mark it as the most recently used
+		self.entries[key] = entry
+		self.hits += 1
+		return entry
+
+	def store(self, key, entry):
+		" Store an entry, replacing the least recently used one if full "
+		if self.size < 1:
+			return
+		if len(self.entries) >= self.size:
+			self.entries.popitem(last=False)
+		self.entries[key] = entry
+
+	def hit_rate(self):
+		" Fraction of lookups that found an entry "
+		lookups = self.hits + self.misses
+		if not lookups:
+			return 0.0
+		return float(self.hits) / lookups
+
+	def clear(self):
+		" Remove all entries and reset the counters "
+		self.entries.clear()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+
+class SearchMetrics(object):
+	"""
+	Measures where the searches of a ComputerPlayer spend their time, and the
+	shape of the trees they search. It replaces the players methods that
+	generate successors, score nodes and make moves with timed ones, so a 
+	player without it runs none of this code. Times are in seconds.
+	"""
+
+	def __init__(self, player):
+		self.times = {'successors': 0.0, 'utility': 0.0, 'moves': 0.0}
+		# number of successors of each expanded node: number of nodes
+		self.branching = {}
+		self.max_depth = 0
+		player._successors = self._timed_successors(player._successors)
+		player._utility = self._timed(player._utility, 'utility')
+		player._make_move = self._timed(player._make_move, 'moves')
+		player._unmake_move = self._timed(player._unmake_move, 'moves')
+		if player.batch:
+			player.batch.score = self._timed(player.batch.score, 'utility')
+
+	def reset(self):
+		" Clear the measurements, before a search "
+		for name in self.times:
+			self.times[name] = 0.0
+		self.branching.clear()
+		self.max_depth = 0
+
+	def as_dict(self):
+		" Return the measurements of the last search "
+		return {
+			'max_depth': self.max_depth,
+			'branching': dict(self.branching),
+			'time_successors': self.times['successors'],
+			'time_utility': self.times['utility'],
+			'time_moves': self.times['moves'],
+		}
+
+	def _timed(self, method, name):
+		" Wrap method to add the time it takes to times[name] "
+		times = self.times
+		def timed(*args):
+			start = time.time()
+			try:
+				return method(*args)
+			finally:
+				times[name] += time.time() - start
+		return timed
+
+	def _timed_successors(self, successors):
+		"""
+		Wrap the successors generator, timing the creation of each successor. 
+		Nodes whose successors are all created are counted in branching.
+		"""
+		times = self.times
+		branching = self.branching
+		def timed(node):
+			children = successors(node)
+			count = 0
+			while True:
+				start = time.time()
+				child_node = next(children, None)
+				times['successors'] += time.time() - start
+				if child_node is None:
+					break
+				count += 1
+				yield child_node
+			branching[count] = branching.get(count, 0) + 1
+			if count and node.depth >= self.max_depth:
+				self.max_depth = node.depth + 1
+		return timed
 
 
 #TODO: change this so that non terminal moves can be considered. For example if the computer can play
@@ -62,52 +240,449 @@ class ComputerPlayer(Player):
 	MIN_VALUE = -sys.maxint 
 	MAX_VALUE = sys.maxint
 
-	def __init__(self):
-		" setup the ai "
+	def __init__(self, transposition_size=100000, processes=1, time_budget=None,
+			node_budget=None, weights=None, batch=False, ponder=False,
+			metrics=False, profile=None, dedupe=True, skip_permutations=False, prune=True):
+		"""
+		setup the ai. If processes is more than 1, the moves from the starting 
+		state are searched in parallel by a pool of that many processes.
+
+		weights is the Weights used to score moves, the defaults if it is None.
+		If batch is True the successors of each node are scored together with
+		numpy arrays, see batch.py. With the few successors of a node in this
+		game that is slower than scoring them one at a time.
+
+		If a time_budget (in seconds) or node_budget is set, the search is 
+		deepened one move at a time until it reaches the end of every path or the
+		budget runs out, and the best path of the deepest finished search is 
+		played. Budgeted searches use a single process.
+
+		If ponder is True, states passed to ponder() are searched in a background
+		thread, and the result is used if play_card is called with one of them.
+
+		If dedupe is True only the first card of each rank in the hand is moved,
+		the others lead to the same values. If skip_permutations is True, of the
+		two orders two independent center plays can be made in only one is 
+		searched, see _is_permutation. Both orders reach the same state, but the
+		value of a path depends on the order of its moves, so this can change
+		the chosen path, and it is off by default.
+
+		If prune is True the opponent's replies to a discard are searched once
+		for all the discards from the same state, see _evaluate_discard. The 
+		same path is chosen as without it, in fewer nodes, so with a budget the
+		search can get deeper.
+
+		After each search last_metrics is a dict of its counts, and metrics_json
+		returns it as json. If metrics is True it also has the times spent creating
+		successors, scoring nodes and making moves, the deepest node, and the
+		number of successors of each node, see SearchMetrics. If profile is a
+		file name, the searches are run with cProfile, and the stats of all of
+		them are written to it after each one. With processes the counts are
+		only for the starting node, the rest are in the workers.
+		"""
 		# list of moves stored up
 		self.play_queue = []
+		# results of searched states, reused when a state is reached again
+		self.transpositions = TranspositionTable(transposition_size)
+		self.transposition_size = transposition_size
+		self.processes = processes
+		self.pool = None
+		self.time_budget = time_budget
+		self.node_budget = node_budget
+		self.weights = weights or Weights()
+		self.batch = None
+		if batch:
+			from batch import BatchUtility
+			self.batch = BatchUtility(self)
+		# depth of the current search, None for no limit
+		self.max_depth = None
+		self.out_of_budget = False
+		# counts for the last search, search_depth is None if it was not limited
+		self.terminal_count = 0
+		self.node_count = 0
+		self.cutoffs = 0
+		self.search_depth = None
+		# set to stop the search, from another thread
+		self.stopped = False
+		self.ponder_enabled = ponder
+		self.ponderer = None
+		self.ponder_hits = 0
+		self.ponder_misses = 0
+		self.last_metrics = {}
+		self.metrics = None
+		if metrics:
+			self.metrics = SearchMetrics(self)
+		self.profile = profile
+		self.profiler = None
+		self.dedupe = dedupe
+		self.skip_permutations = skip_permutations
+		self.prune = prune
+		# number of discards evaluated without searching the replies to them
+		self.pruned = 0
+
+	def _search_settings(self):
+		"""
+		Return the keyword arguments for a ComputerPlayer that searches the same
+		way as this one. The ponderer and the worker processes are created with
+		them.
+		"""
+		return {
+			'transposition_size': self.transposition_size,
+			'weights': self.weights,
+			'batch': self.batch is not None,
+			'dedupe': self.dedupe,
+			'skip_permutations': self.skip_permutations,
+			'prune': self.prune,
+		}
 
 	def play_card(self, game_state):
 		"""
 		my_cards: cards in their hand, the top card on their payoff stack, and their discard piles.
 		opponents_cards: the top card of the opponents payoff stack, and their discard piles.
 		center_stacks: the enter center stacks
+
+		Returns None if there is no legal move, which ends the game.
 		"""
 		# play queued moves if we have some
 		if len(self.play_queue) > 0:
-			sleep(0.3)
 			return self.play_queue.pop(0)
 
-		# find the best possible move
-		self.terminal_nodes = []
+		# use the result of pondering, if this state was searched
+		chain = None
+		if self.ponderer:
+			chain = self.ponderer.result(game_state)
+			if chain is None:
+				self.ponder_misses += 1
+			else:
+				self.ponder_hits += 1
+				self.last_metrics = {'ponder_hits': self.ponder_hits,
+						'ponder_misses': self.ponder_misses}
+				log.info("Using pondered path, %d of %d pondered states were played",
+						self.ponder_hits, self.ponder_hits + self.ponder_misses)
+				self.play_queue = map(self._unpack_move, chain)
+				return self.play_queue.pop(0)
+
+		chain = self._search(game_state)
+		if chain is None:
+			log.warn("No legal move to play")
+			return None
+		self._build_play_queue(chain)
+		return self.play_queue.pop(0)
+
+
+	def ponder(self, states):
+		"""
+		Search states in a background thread, so the move is ready if play_card
+		is called with one of them. Replaces the states of the last call. Does
+		nothing unless the player was created with ponder set.
+		"""
+		if not self.ponder_enabled:
+			return
+		if not self.ponderer:
+			searcher = ComputerPlayer(time_budget=self.time_budget,
+					node_budget=self.node_budget, **self._search_settings())
+			self.ponderer = Ponderer(searcher)
+			self.ponderer.start()
+		self.ponderer.set_states(states)
+
+
+	def _search(self, game_state):
+		"""
+		Search game_state, and return the chain of actions of the best path, or
+		None if there are no moves. Once the stock has run out a player can be
+		left with an empty hand and nothing to play on the center.
+		"""
+		self.terminal_count = 0
+		self.node_count = 0
+		self.cutoffs = 0
+		self.pruned = 0
+		self.search_depth = None
+		self.search_start = time.time()
+		hits, misses = self.transpositions.hits, self.transpositions.misses
+		if self.metrics:
+			self.metrics.reset()
+		if self.profile:
+			if not self.profiler:
+				import cProfile
+				self.profiler = cProfile.Profile()
+			self.profiler.enable()
 		node = StateNode(game_state)
-		self._evaluate(node)
+		try:
+			if self.time_budget or self.node_budget:
+				best = self._evaluate_iterative(node)
+			elif self.processes > 1:
+				best = self._evaluate_parallel(node)
+			else:
+				best = self._evaluate(node)
+		finally:
+			if self.profiler:
+				self.profiler.disable()
+				self.profiler.dump_stats(self.profile)
+		self.last_metrics = self._search_metrics(self.transpositions.hits - hits,
+				self.transpositions.misses - misses)
+		if best is None:
+			return None
+		return best[1]
+
+
+	def _search_metrics(self, hits, misses):
+		" Return a dict of the counts of the last search, and its transposition lookups "
+		metrics = {
+			'nodes': self.node_count,
+			'terminals': self.terminal_count,
+			'cutoffs': self.cutoffs,
+			'pruned': self.pruned,
+			'search_depth': self.search_depth,
+			'time': time.time() - self.search_start,
+			'transpositions': {
+				'hits': hits,
+				'misses': misses,
+				'hit_rate': float(hits) / max(hits + misses, 1),
+				'size': len(self.transpositions),
+			},
+			'ponder_hits': self.ponder_hits,
+			'ponder_misses': self.ponder_misses,
+		}
+		if self.metrics:
+			metrics.update(self.metrics.as_dict())
+		return metrics
 
-		self._build_play_queue()
-		return self.play_queue.pop(0)
+
+	def metrics_json(self):
+		" Return last_metrics as json "
+		return json.dumps(self.last_metrics, sort_keys=True)
+
+
+	def _evaluate_iterative(self, node):
+		"""
+		Evaluate the starting node with a search limited to max_depth moves,
+		increasing max_depth until no paths were cut off or the budget is used up.
+		Returns the result of the deepest search that finished. The first search
+		always finishes, so there is always a move to play.
+		"""
+		best = None
+		self.out_of_budget = False
+		self.max_depth = 0
+		while True:
+			self.max_depth += 1
+			cutoffs = self.cutoffs
+			result = self._evaluate(StateNode(node.state))
+			if self.out_of_budget:
+				break
+			best = result
+			self.search_depth = self.max_depth
+			if self.cutoffs == cutoffs:
+				break
+		self.max_depth = None
+		return best
+
+
+	def _check_budget(self):
+		" Returns True if the budget for this search is used up "
+		if self.max_depth < 2:
+			return False
+		if self.node_budget and self.node_count >= self.node_budget:
+			self.out_of_budget = True
+		elif self.time_budget and time.time() - self.search_start >= self.time_budget:
+			self.out_of_budget = True
+		return self.out_of_budget
+
+
+	def _evaluate_parallel(self, node):
+		"""
+		Evaluate the starting node by searching each of its child nodes in a 
+		worker process. Results are merged in the same order as _evaluate, so
+		the best path is the same as for a search in a single process.
+		"""
+		self._terminal_test(node)
+		node.child_nodes = list(node.child_nodes)
+		if len(node.child_nodes) < 2:
+			return self._evaluate(node)
+
+		if not self.pool:
+			self.pool = multiprocessing.Pool(self.processes, _init_worker,
+					(self._search_settings(),))
+		tasks = [(node.state, child_node.action, child_node.player, child_node.swap_player)
+				for child_node in node.child_nodes]
+
+		best = None
+		for child_node, (result, terminal_count) in zip(node.child_nodes,
+				self.pool.imap(_evaluate_subtree, tasks)):
+			self.terminal_count += terminal_count
+			if result and (not best or result[0] > best[0]):
+				best = result[0], [child_node.action] + result[1]
+		node.child_nodes = []
+		return best
+
+
+	def close(self):
+		" Stop the worker processes and pondering thread, if there are any "
+		if self.pool:
+			self.pool.terminate()
+			self.pool = None
+		if self.ponderer:
+			self.ponderer.stop()
+			self.ponderer = None
 
 
 	def _evaluate(self, node):
-		" Evaluate a node, and recurse if necessary "
+		"""
+		Evaluate a node, and recurse if necessary. Returns a tuple of the best 
+		util value of the terminal nodes under this node, and the list of actions
+		for SELF that lead to it. Returns None if there are no terminal nodes.
+		In the case of a tie, the first terminal node found is used.
+
+		If the depth of the search is limited, nodes at max_depth are evaluated
+		as if they were terminal, and counted in cutoffs.
+
+		With prune set, the discards after the first one are evaluated from the
+		gain of the replies to it, unless part of the search for them was cut off.
+		"""
+		if self.stopped:
+			raise SearchStopped()
+		self.node_count += 1
+		cutoffs = self.cutoffs
 		# no reason to get util for starting state
 		if node.parent_node:
-			node.util_value = self._utility(node)
+			if node.util_value is None:
+				node.util_value = self._utility(node)
+			# reuse the result if this state has been searched before
+			key = self._transposition_key(node)
+			entry = self.transpositions.get(key)
+			if entry:
+				gain, chain, center_lengths = entry
+				if gain is None:
+					return None
+				return node.util_value + gain, self._map_center_moves(
+						chain, center_lengths, node.state.center_stacks)
 
 		if self._terminal_test(node):
-			log.info("Adding terminal %s" % node)
-			self.terminal_nodes.append(node)
-			return
+			if TRACE:
+				log.info("Adding terminal %s", node)
+			self.terminal_count += 1
+			best = node.util_value, []
+		elif self.max_depth and node.depth >= self.max_depth and node.child_nodes:
+			self.cutoffs += 1
+			best = node.util_value, []
+			node.child_nodes = []
+		else:
+			# evaluate all child nodes
+			if TRACE:
+				log.debug("Evaluating successors of %s", node)
+			child_nodes = node.child_nodes
+			if self.batch:
+				child_nodes = list(child_nodes)
+				for child_node, value in zip(child_nodes, self.batch.score(node, child_nodes)):
+					child_node.util_value = value
+			best = None
+			# gain of the replies to the first discard, in a list once it is known
+			replies = None
+			for child_node in child_nodes:
+				if self.max_depth and self._check_budget():
+					self.cutoffs += 1
+					break
+				self._make_move(child_node)
+				if replies and child_node.action.to_pile == DISCARD:
+					result = self._evaluate_discard(child_node, replies[0])
+				else:
+					child_cutoffs = self.cutoffs
+					result = self._evaluate(child_node)
+					if self.prune and child_node.action.to_pile == DISCARD and \
+							self.cutoffs == child_cutoffs:
+						replies = [result and result[0] - child_node.util_value]
+				self._unmake_move(child_node)
+				if result and (not best or result[0] > best[0]):
+					value, chain = result
+					if child_node.player == StateNode.SELF:
+						chain = [child_node.action] + chain
+					best = value, chain
+			node.child_nodes = []
+
+		# store the gain relative to this node, so it can be used from any path,
+		# unless part of the search under it was cut off
+		if node.parent_node and self.cutoffs == cutoffs:
+			center_lengths = map(len, node.state.center_stacks)
+			if best:
+				self.transpositions.store(key, (best[0] - node.util_value, best[1], center_lengths))
+			else:
+				self.transpositions.store(key, (None, None, center_lengths))
+		return best
+
 
-		# evaluate all child nodes
-		log.debug("Evaluating %d succcessor" % len(node.child_nodes))
-		for child_node in node.child_nodes:
-			self._evaluate(child_node)
+	def _evaluate_discard(self, node, reply_gain):
+		"""
+		Evaluate a discard of SELF after the opponent's replies to another discard
+		from the same state were searched. The replies only depend on the center
+		stacks and the opponent's cards, which a discard doesn't change, so they
+		gain the same, reply_gain, or there are none if it is None. Returns the
+		same as _evaluate.
+		"""
+		self.node_count += 1
+		self.pruned += 1
+		if node.util_value is None:
+			node.util_value = self._utility(node)
+		if reply_gain is None:
+			return None
+		return node.util_value + reply_gain, []
+
+
+	@staticmethod
+	def _transposition_key(node):
+		"""
+		Build the key used to look up the search results of a node. A nodes 
+		subtree depends on its state, the player, and the kind of move that
+		was made to reach it.
+		"""
+		return (node.state.zobrist_hash(), node.player, node.action.from_pile == PAY_OFF,
+				node.action.to_pile, not node.parent_node.action)
+
+
+	@staticmethod
+	def _map_center_moves(chain, from_lengths, center_stacks):
+		"""
+		The hash of a state treats center stacks with the same length as equal, so 
+		a stored chain may have been found with the stacks in a different order.
+		Move each center move of chain to the stack the search would have used, 
+		the first stack with the same length.
+		"""
+		to_lengths = map(len, center_stacks)
+		if from_lengths == to_lengths:
+			return chain
+		from_lengths = list(from_lengths)
+		mapped_chain = []
+		for action in chain:
+			if action.to_pile == CENTER:
+				length = from_lengths[action.to_id]
+				to_id = to_lengths.index(length)
+				from_lengths[action.to_id] += 1
+				to_lengths[to_id] += 1
+				action = PlayerMove(action.card, from_pile=action.from_pile,
+						from_id=action.from_id, to_pile=CENTER, to_id=to_id)
+			mapped_chain.append(action)
+		return mapped_chain
+
+
+	@staticmethod
+	def _make_move(node):
+		" Apply the action of node to the shared state. "
+		if node.swap_player:
+			node.state.swap_players()
+		node.state.place_card(node.action)
+
+
+	@staticmethod
+	def _unmake_move(node):
+		" Reverse the action of node, restoring the state of its parent node. "
+		node.state.undo_move()
+		if node.swap_player:
+			node.state.swap_players()
 
 
 	def _terminal_test(self, node):
 		"""
 		Check if this node is the last node in its path that can be evaluated. If
-		it is not calls sucessors to populate the child nodes of the node.
+		it is not sets the child nodes of the node to an iterator over its 
+		successors, which are only created as they are searched.
 		Returns True if this is a terminal node, False otherwise.
 		"""
 		# if nothing was done, can't be a terminal node
@@ -129,8 +704,13 @@ class ComputerPlayer(Player):
 			if node.action.to_pile == DISCARD and node.parent_node and not node.parent_node.action:
 				return True
 
-		# otherwise generate successors
-		node.child_nodes = self._successors(node)
+		# otherwise generate successors, creating the first to see if there are any
+		children = self._successors(node)
+		first = next(children, None)
+		if first is None:
+			node.child_nodes = []
+		else:
+			node.child_nodes = itertools.chain([first], children)
 
 		# we've played center cards, so we want to see what the opponent can do
 		if node.action.to_pile == DISCARD and node.player == StateNode.SELF:
@@ -145,10 +725,13 @@ class ComputerPlayer(Player):
 
 	def _successors(self, node):
 		"""
-		Return a list of successor nodes for the current node. Each node is a valid move.
+		Generate the successor nodes for the current node. Each node is a valid move.
+		Successor nodes share the state of node, their action is only applied to it
+		while they are being evaluated, and it must be undone before the next one
+		is generated.
 		"""
-		log.debug("Generating successors for %s" % node)
-		node_list = []
+		if TRACE:
+			log.debug("Generating successors for %s", node)
 
 		# opponent plays card on center
 		if node.player == StateNode.OTHER or (node.action and node.action.to_pile == DISCARD):
@@ -156,82 +739,107 @@ class ComputerPlayer(Player):
 			for pile_name, pile_len in [(PAY_OFF,1), (DISCARD,4)]:
 				for pile_id in range(pile_len):
 					for action in self._get_center_move_from(node.state, pile_name, pile_id, swap_player):
-						new_state = ComputerPlayer._new_state_from_action(node.state, action, swap_player)
-						new_node = StateNode(new_state, action, node, player=StateNode.OTHER)
-						node_list.append(new_node)
-			return node_list
+						yield StateNode(node.state, action, node, player=StateNode.OTHER,
+								swap_player=swap_player)
+			return
 
 		# moves to center
 		for pile_name, pile_len in [(HAND,1), (PAY_OFF,1), (DISCARD,4)]:
 			for pile_id in range(pile_len):
-				for action in self._get_center_move_from(node.state, pile_name, pile_id):
-					new_state = ComputerPlayer._new_state_from_action(node.state, action)
-					new_node = StateNode(new_state, action, node)
-					node_list.append(new_node)
+				for action in self._get_center_move_from(node.state, pile_name, pile_id,
+						dedupe=self.dedupe):
+					if self.skip_permutations and self._is_permutation(node, action):
+						continue
+					yield StateNode(node.state, action, node)
 
 		# moves to discard
+		ranks = set()
 		for card in node.state.get_player()[HAND]:
 			# can't discard kings
-			if Card.to_numeric_value(card) == 13:
+			if card >> RANK_SHIFT == 13:
 				continue
+			if self.dedupe:
+				if card >> RANK_SHIFT in ranks:
+					continue
+				ranks.add(card >> RANK_SHIFT)
 			# only create moves for different discard pile states
 			discard_pile_values = []
 			discard_pile_ids = []
 			for i in range(len(node.state.get_player()[DISCARD])):
 				value = None
 				if len(node.state.get_player()[DISCARD][i]):
-					value = Card.to_numeric_value(node.state.get_player()[DISCARD][i][-1])
+					value = node.state.get_player()[DISCARD][i][-1] >> RANK_SHIFT
 				if value not in discard_pile_values:
 					discard_pile_values.append(value)
 					discard_pile_ids.append(i)
 			# find the moves
 			for pile_id in discard_pile_ids: 
 				action = PlayerMove(card, from_pile=HAND, to_pile=DISCARD, to_id=pile_id)
-				new_state = ComputerPlayer._new_state_from_action(node.state, action)
-				new_node = StateNode(new_state, action, node)
-				node_list.append(new_node)
-		return node_list
+				yield StateNode(node.state, action, node)
 	
 
 
 	@staticmethod
-	def _get_center_move_from(state, pile_name, pile_index, other_player=False):
-		" Get all the valid center stack placements from a pile "
+	def _get_center_move_from(state, pile_name, pile_index, other_player=False, dedupe=False):
+		"""
+		Get all the valid center stack placements from a pile. Only the first 
+		center stack of each length is used, the others lead to the same values.
+		These are kept by the state, see GameState.center_targets. If dedupe is
+		True only the first card of each rank in the pile is used.
+		"""
 		moves = []
 
 		# set pile to HAND or PAY_OFF stacks
 		pile = state.get_player(other_player)[pile_name]
 		# otherwise, set it to top of DISCARD
 		if pile_name == DISCARD:
-			if len(state.get_player(other_player)[pile_name][pile_index]) < 1:
+			pile = pile[pile_index]
+			if len(pile) < 1:
 				return moves
-			pile = [state.get_player(other_player)[pile_name][pile_index][-1]]
-		# only include center piles of different lengths
-		center_lengths = []
-		center_ids = []
-		for i in range(len(state.center_stacks)):
-			length = len(state.center_stacks[i])
-			if length not in center_lengths:
-				center_ids.append(i)
-				center_lengths.append(length)
+			pile = pile[-1:]
 		# find the moves
-		for i in range(len(pile)):
-			card = pile[i]
-			for center_id in center_ids:
-				if state.can_place_card_in_center(state.center_stacks[center_id], card):
-					moves.append(PlayerMove(card, from_pile=pile_name, from_id=pile_index,
-							to_pile=CENTER, to_id=center_id))
+		center_targets = state.center_targets
+		ranks = set()
+		for card in pile:
+			if dedupe:
+				if card >> RANK_SHIFT in ranks:
+					continue
+				ranks.add(card >> RANK_SHIFT)
+			for center_id in center_targets[card >> RANK_SHIFT]:
+				moves.append(PlayerMove(card, from_pile=pile_name, from_id=pile_index,
+						to_pile=CENTER, to_id=center_id))
 		return moves
 
-	
 	@staticmethod
-	def _new_state_from_action(state, action, swap_player=False):
-		" Return a new state created from the previous state and the action "
-		new_state = deepcopy(state)
-		if swap_player:
-			new_state.swap_players()
-		new_state.place_card(action)
-		return new_state
+	def _is_permutation(node, action):
+		"""
+		Return True if action, a center play by the player who made the center
+		play of node, is independent of it and comes first in the canonical order
+		of plays. Then the same two plays in the other order are searched from
+		the parent of node, and reach a state with the same hash.
+
+		Plays are independent if they are to different center stacks, the card
+		of action was not under the card of node, and playing action first
+		doesn't end the path by emptying the hand. Plays are ordered by their
+		pile and the rank of their card, not by their center stack, which can
+		differ between the orders when stacks have the same length.
+
+		Only used for plays of SELF, which can always discard instead, so a node
+		never becomes terminal because its plays were skipped.
+		"""
+		previous = node.action
+		if not previous or previous.to_pile != CENTER:
+			return False
+		if action.from_pile == PAY_OFF or action.to_id == previous.to_id:
+			return False
+		if action.from_pile == DISCARD and previous.from_pile == DISCARD and \
+				action.from_id == previous.from_id:
+			return False
+		if action.from_pile == HAND and previous.from_pile != HAND and \
+				len(node.state.get_player()[HAND]) == 1:
+			return False
+		return (action.from_pile, action.from_id, action.card >> RANK_SHIFT) < \
+				(previous.from_pile, previous.from_id, previous.card >> RANK_SHIFT)
 
 	class PointTracker(dict):
 		"""
@@ -250,40 +858,10 @@ class ComputerPlayer(Player):
 		""" 
 		Calculate the utility value for this state node.
 		"""
-		ALL = 'all'
-		# FIXME: Balance points so that placing on center only when necesarry (discard full, or no closer to po for op)
-		points = {
-			# to discard pile
-			DISCARD: (10, {
-				'on_same': 50,			# Discard on same value card
-				'on_empty': 30,			# Discard on empty pile
-				'common_in_hand': 10,	# Each time the discard card occures in the hard
-				'least_essential': 5,	# Discard least essential card
-				'bury_least': 2,		# Discard buries the least essential card
-			}),
-			# to center
-			CENTER: (0, {
-				'pay_off': 1000,		# Play the pay off card
-			}),
-			# from hand
-			HAND: (0, {
-				'empty_hand': 120,		# Empty hand without a discard
-			}),
-			# All moves
-			ALL: {
-				'op_dist_po': 30,		# Each point away the closest center is from opponents pay off (max *12)
-			},
-			# Opponent play
-			StateNode.OTHER: (0, {
-				'from_discard': -10,	# Opponent plays from discard
-				'from_pay_off': -1000,	# Opponent plays pay_off card
-			})
-		}
+		weights = self.weights
 
 		# shortcut vars
-		center_values = []
-		for pile in node.state.center_stacks:
-			center_values.append(len(pile))
+		center_values = [len(pile) for pile in node.state.center_stacks]
 		if node.player == StateNode.SELF:
 			myself = node.state.get_player()
 			other = node.state.get_player(True)
@@ -291,75 +869,75 @@ class ComputerPlayer(Player):
 			myself = node.state.get_player(True)
 			other = node.state.get_player()
 
-
 		value = 0
 		# each point away the closest center is from opponents pay off
 		if len(other[PAY_OFF]):
-			value += points[ALL]['op_dist_po'] * \
-					self._find_min_center_distance(center_values, other[PAY_OFF][-1])
+			value += weights.op_dist_po * \
+					self._find_min_center_distance(center_values, other[PAY_OFF][-1] >> RANK_SHIFT)
 		if node.player == StateNode.SELF:
-
-			if node.action.to_pile == DISCARD:
-				value += points[DISCARD][0]
+			action = node.action
+
+			if action.to_pile == DISCARD:
+				card_value = action.card >> RANK_SHIFT
+				hand_values = [card >> RANK_SHIFT for card in myself[HAND]]
+				pay_off_value = myself[PAY_OFF][-1] >> RANK_SHIFT
+				discard_pile = myself[DISCARD][action.to_id]
+				value += weights.discard
 				# discard on empty pile
-				if len(myself[DISCARD][node.action.to_id]) == 1:
-					value += points[DISCARD][1]['on_empty']
+				if len(discard_pile) == 1:
+					value += weights.discard_on_empty
 				# discard on same value card
-				if len(myself[DISCARD][node.action.to_id]) > 1 \
-						and Card.to_numeric_value(myself[DISCARD][node.action.to_id][-1]) == \
-						Card.to_numeric_value(myself[DISCARD][node.action.to_id][-2]):
-					value += points[DISCARD][1]['on_same']
+				if len(discard_pile) > 1 and \
+						discard_pile[-1] >> RANK_SHIFT == discard_pile[-2] >> RANK_SHIFT:
+					value += weights.discard_on_same
 				# each time the discard cards value ocurs in the hand
-				value += points[DISCARD][1]['common_in_hand'] * \
-						map(lambda c: Card.to_numeric_value(c), myself[HAND]).count(
-						Card.to_numeric_value(node.action.card))
+				value += weights.discard_common_in_hand * hand_values.count(card_value)
 				# discard least essential card
 				if 0 == self._find_least_essential_card(
-						center_values, [node.action.card] + myself[HAND], myself[PAY_OFF][-1]):
-					value += points[DISCARD][1]['least_essential']
+						center_values, [card_value] + hand_values, pay_off_value):
+					value += weights.discard_least_essential
 				# discard buries least essential card
-				if len(myself[DISCARD][node.action.to_id]) >= 1:
+				if len(discard_pile) >= 1:
 					discard_piles = self._build_pre_play_discard_piles(node)
-					if node.action.to_id == self._find_least_essential_card(center_values,
-							discard_piles, myself[PAY_OFF][-1]):
-						value += points[DISCARD][1]['bury_least']
+					if action.to_id == self._find_least_essential_card(center_values,
+							discard_piles, pay_off_value):
+						value += weights.discard_bury_least
 
-			elif node.action.to_pile == CENTER:
-				value += points[CENTER][0]
+			elif action.to_pile == CENTER:
+				value += weights.center
 				# pay off played
-				if node.action.from_pile == PAY_OFF:
-					value += points[CENTER][1]['pay_off']
+				if action.from_pile == PAY_OFF:
+					value += weights.center_pay_off
 
-			if node.action.from_pile == HAND:
-				value += points[HAND][0]
+			if action.from_pile == HAND:
+				value += weights.hand
 				# empty hand without a discard
-				if len(myself[HAND]) == 0 and node.action.to_pile != DISCARD:
-					value += points[HAND][1]['empty_hand']
+				if len(myself[HAND]) == 0 and action.to_pile != DISCARD:
+					value += weights.hand_empty
 
 		# opponents plays
 		else:
-			value += points[StateNode.OTHER][0]
+			value += weights.other
 			if node.action.from_pile == PAY_OFF:
-				value += points[StateNode.OTHER][1]['from_pay_off']
+				value += weights.other_from_pay_off
 			if node.action.from_pile == DISCARD:
-				value += points[StateNode.OTHER][1]['from_discard']
+				value += weights.other_from_discard
 
 		# cumulative utils
-		log.debug("Util %d " % (value))
 		return value + node.parent_node.util_value
 
 
 	@staticmethod
 	def _build_pre_play_discard_piles(node):
-		" build a list of the pre play discard piles top cards "
+		" build a list of the values of the pre play discard piles top cards "
 		discard = node.state.get_player()[DISCARD]
 		discard_piles = []
 		for pile_id in range(len(discard)):
 			pile = discard[pile_id]
 			if len(pile) > 1 and node.action.to_id:
-				discard_piles.append(pile[-2])
+				discard_piles.append(pile[-2] >> RANK_SHIFT)
 			elif len(pile) > 1:
-				discard_piles.append(pile[-1])
+				discard_piles.append(pile[-1] >> RANK_SHIFT)
 			else:
 				discard_piles.append(None)
 		return discard_piles
@@ -369,35 +947,29 @@ class ComputerPlayer(Player):
 	def _find_least_essential_card(center_values, pile, pay_off_card):
 		"""
 		Return the index in pile that is considered least essential relative to the
-		pay off card.
-		"""
-		min_score = ComputerPlayer.MAX_VALUE
-		min_card = None
+		pay off card. pile is a list of card values, or None for no card.
 
-		# arrange the center piles by furthest to closest card
-		value_to_center_distance = {}
-		for i in range(len(center_values)):
-			dist = ComputerPlayer._distance_between_values(center_values[i], pay_off_card)
-			value_to_center_distance[center_values[i]] = dist
-		center_values.sort(cmp=lambda a, b: value_to_center_distance[b] - value_to_center_distance[a])
+		Each card scores 2**i for each center pile i it is between the top of and
+		the pay off card, with the center piles ordered from furthest to closest
+		to the pay off card. The first card with the lowest score is least 
+		essential. Cards are sets of bits, so the lowest scores are found by 
+		removing the cards with the highest bits first, for all cards at once.
+		"""
+		distance = DISTANCE[pay_off_card]
+		between = BETWEEN[pay_off_card]
+
+		# no card is bit 0, which is never between values
+		cards = 0
+		for card in pile:
+			cards |= 1 << (card or 0)
+		ordered = sorted(center_values, key=distance.__getitem__, reverse=True)
+		for center_value in reversed(ordered):
+			if cards & ~between[center_value]:
+				cards &= ~between[center_value]
 
-		# find the lowest score for cards in the pile
 		for i in range(len(pile)):
-			score = 0
-			card = pile[i]
-			# calculate the score for each center pile
-			for center_id in range(len(center_values)):
-				if ComputerPlayer._is_card_between_values(card, center_values[center_id], pay_off_card):
-					score += 2**center_id
-
-			# store the minimum
-			if score < min_score:
-				min_score = score
-				min_card = card
-
-		log.debug("Least essential card for center_values[%s] and pay_off[%s]: %s" % (
-			"".join(map(str, center_values)), pay_off_card, min_card))
-		return pile.index(min_card)
+			if cards >> (pile[i] or 0) & 1:
+				return i
 
 
 	@staticmethod
@@ -406,7 +978,8 @@ class ComputerPlayer(Player):
 		return the value from the center stack that is closest available
 		for playing the pay_off_card.
 		"""
-		return min(map(lambda v: ComputerPlayer._distance_between_values(v, pay_off_card), center_values))
+		distance = DISTANCE[pay_off_card]
+		return min([distance[value] for value in center_values])
 
 
 	@staticmethod
@@ -442,28 +1015,139 @@ class ComputerPlayer(Player):
 			center_card -= 11
 		return (center_card < card < pay_off)
 
-	def _build_play_queue(self):
-		"""
-		Find the best path, and build the play queue for this path.
-		In the case of a tie, pick a random path
-		"""
-		log.info("Choosing from %d possible paths" % len(self.terminal_nodes))
-		node = max(self.terminal_nodes, key=lambda s: s.util_value)
+	def _build_play_queue(self, chain):
+		" Build the play queue from the chain of actions of the best path "
+		chain = map(self._unpack_move, chain)
+		self.play_queue = chain
+		if not log.isEnabledFor(logging.INFO):
+			return
+		log.info("Chose from %d possible paths, transpositions hit rate %.2f (%d/%d)",
+				self.terminal_count, self.transpositions.hit_rate(),
+				self.transpositions.hits, self.transpositions.hits + self.transpositions.misses)
+		log.info("Searched %d nodes to depth %s in %.3fs", self.node_count,
+				self.search_depth or 'max', time.time() - self.search_start)
+		log.info("Chosing path: %s", " ".join(map(unicode, chain)))
 
-		chain = []
-		# loop while there are still nodes in the chain
-		while node:
-			# skip any opponent nodes we have in the chain
-			if node.player == StateNode.OTHER:
-				node = node.parent_node
-				continue
-			chain.append(node.action)
-			node = node.parent_node
 
-		# remove the starting state, and reverse the list, so we can traverse the path
-		chain.pop()
-		chain.reverse()
-		log.info("Chosing path: %s" % (" ".join(map(unicode, chain))))
-		self.play_queue = chain
+	@staticmethod
+	def _unpack_move(action):
+		" Convert a move made on the packed GameState to a move for the model "
+		return PlayerMove(Card.decode(action.card), from_pile=action.from_pile,
+				from_id=action.from_id, to_pile=action.to_pile, to_id=action.to_id)
 
 
+def _build_value_tables():
+	"""
+	Build the lookup tables for the values of a pay off card, and a center pile
+	length. DISTANCE[pay_off][length] is ComputerPlayer._distance_between_values,
+	and BETWEEN[pay_off][length] has bit n set for each card value n that 
+	ComputerPlayer._is_card_between_values for.
+	"""
+	distance, between = [], []
+	for pay_off in range(len(Card.values) + 2):
+		distance.append([ComputerPlayer._distance_between_values(length, pay_off)
+				for length in range(MAX_CENTER_LENGTH + 1)])
+		between.append([sum([1 << card for card in range(1, len(Card.values) + 2)
+				if ComputerPlayer._is_card_between_values(card, length, pay_off)])
+				for length in range(MAX_CENTER_LENGTH + 1)])
+	return distance, between
+
+DISTANCE, BETWEEN = _build_value_tables()
+
+
+class Ponderer(threading.Thread):
+	"""
+	Searches states with its own ComputerPlayer in a background thread, and keeps
+	the best path for each of them, by the hash of the state. The hash treats
+	center stacks of the same length as equal, so the paths are moved to the
+	stacks of the state they are used for, as transpositions are.
+	"""
+
+	def __init__(self, searcher):
+		threading.Thread.__init__(self, name="ponderer")
+		self.daemon = True
+		self.searcher = searcher
+		self.condition = threading.Condition()
+		# states waiting to be searched, the hash of the one being searched, and
+		# the chain of actions found for each state, with its center stack lengths
+		self.states = []
+		self.searching = None
+		self.results = {}
+		self.finished = False
+
+	def set_states(self, states):
+		" Search states instead of the current ones "
+		with self.condition:
+			self.states = list(states)
+			self.results = {}
+			self.searcher.stopped = True
+			self.condition.notify_all()
+
+	def result(self, state):
+		"""
+		Stop pondering, and return the chain of actions found for state, or None
+		if it wasn't searched. Waits for the search if state is being searched.
+		"""
+		key = state.zobrist_hash()
+		with self.condition:
+			self.states = []
+			if self.searching != key:
+				self.searcher.stopped = True
+			while self.searching is not None:
+				self.condition.wait()
+			if key not in self.results:
+				return None
+			chain, center_lengths = self.results[key]
+		return ComputerPlayer._map_center_moves(chain, center_lengths, state.center_stacks)
+
+	def stop(self):
+		" Stop searching, and end the thread "
+		with self.condition:
+			self.finished = True
+			self.searcher.stopped = True
+			self.condition.notify_all()
+		self.join()
+
+	def run(self):
+		while True:
+			with self.condition:
+				while not self.states and not self.finished:
+					self.condition.wait()
+				if self.finished:
+					return
+				state = self.states.pop(0)
+				self.searching = state.zobrist_hash()
+				self.searcher.stopped = False
+			try:
+				chain = self.searcher._search(state)
+			except SearchStopped:
+				chain = None
+			with self.condition:
+				if chain is not None and not self.searcher.stopped:
+					self.results[self.searching] = chain, map(len, state.center_stacks)
+				self.searching = None
+				self.condition.notify_all()
+
+
+# the ComputerPlayer of a worker process, kept between tasks to reuse its transpositions
+_worker_player = None
+
+def _init_worker(settings):
+	"""
+	Create the ComputerPlayer of a worker process, from the _search_settings of
+	the player that started the pool.
+	"""
+	global _worker_player
+	_worker_player = ComputerPlayer(**settings)
+
+def _evaluate_subtree(task):
+	"""
+	Evaluate one child node of the starting state in a worker process. Returns
+	the result of _evaluate for the child node, and the number of terminal nodes.
+	"""
+	state, action, player, swap_player = task
+	_worker_player.terminal_count = 0
+	_worker_player.node_count = 0
+	node = StateNode(state, action, StateNode(state), player, swap_player)
+	_worker_player._make_move(node)
+	return _worker_player._evaluate(node), _worker_player.terminal_count
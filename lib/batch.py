@@ -0,0 +1,164 @@
+"""
+ Scores all the successors of a search node at once, with numpy arrays.
+ Gives the same values as ComputerPlayer._utility. If numpy is not installed
+ each successor is scored with _utility instead.
+
+ The arrays cost more to set up than they save for the few successors a node
+ has in this game, so searches with it are slower, see bench_utility.py. It
+ only pays off for nodes with many more successors.
+"""
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from model import *
+from cardmodels import RANK_SHIFT
+from agent import StateNode, DISTANCE, BETWEEN
+
+
+class BatchUtility(object):
+	"""
+	Calculates the utility values of the successors of a node from the state of
+	the node and their actions, without making the moves.
+	"""
+
+	def __init__(self, player):
+		self.player = player
+		self.weights = player.weights
+		if numpy:
+			self.distance = numpy.array(DISTANCE)
+			self.between = numpy.array(BETWEEN)
+
+	def score(self, node, children):
+		" Return a list of the util values of children, the successors of node "
+		if not children:
+			return []
+		if not numpy:
+			return self._score_each(children)
+		if children[0].player == StateNode.SELF:
+			values = self._score_self(node, children)
+		else:
+			values = self._score_other(node, children)
+		return (values + node.util_value).tolist()
+
+	def _score_each(self, children):
+		" Score each child with _utility, when numpy isn't available "
+		values = []
+		for child_node in children:
+			self.player._make_move(child_node)
+			values.append(self.player._utility(child_node))
+			self.player._unmake_move(child_node)
+		return values
+
+	def _center_lengths(self, state, actions):
+		" Return an array of the center stack lengths after each action "
+		lengths = numpy.tile([len(pile) for pile in state.center_stacks], (len(actions), 1))
+		for i in range(len(actions)):
+			if actions[i].to_pile == CENTER:
+				lengths[i, actions[i].to_id] += 1
+		return lengths
+
+	def _distance_values(self, other, lengths):
+		" Points for the distance from the closest center stack to the opponents pay off "
+		if not len(other[PAY_OFF]):
+			return numpy.zeros(len(lengths), dtype=int)
+		distance = self.distance[other[PAY_OFF][-1] >> RANK_SHIFT]
+		return self.weights.op_dist_po * distance[lengths].min(axis=1)
+
+	def _score_other(self, node, children):
+		" Score opponent plays to the center "
+		weights = self.weights
+		other = node.state.get_player(children[0].swap_player)
+		actions = [child_node.action for child_node in children]
+		from_pay_off = numpy.array([action.from_pile == PAY_OFF for action in actions])
+		from_discard = numpy.array([action.from_pile == DISCARD for action in actions])
+
+		values = self._distance_values(other, self._center_lengths(node.state, actions))
+		# playing the pay off card leaves the opponent without one
+		values[from_pay_off] = 0
+		values += weights.other
+		values += numpy.where(from_pay_off, weights.other_from_pay_off, 0)
+		values += numpy.where(from_discard, weights.other_from_discard, 0)
+		return values
+
+	def _score_self(self, node, children):
+		" Score plays to the center and discards "
+		weights = self.weights
+		state = node.state
+		myself = state.get_player()
+		other = state.get_player(True)
+		actions = [child_node.action for child_node in children]
+		from_hand = numpy.array([action.from_pile == HAND for action in actions])
+		to_center = numpy.array([action.to_pile == CENTER for action in actions])
+		to_discard = ~to_center
+		from_pay_off = numpy.array([action.from_pile == PAY_OFF for action in actions])
+
+		values = self._distance_values(other, self._center_lengths(state, actions))
+		values += numpy.where(to_center, weights.center, 0)
+		values += numpy.where(to_center & from_pay_off, weights.center_pay_off, 0)
+		values += numpy.where(from_hand, weights.hand, 0)
+		if len(myself[HAND]) == 1:
+			values += numpy.where(from_hand & to_center, weights.hand_empty, 0)
+		if to_discard.any():
+			values[to_discard] += self._score_discards(state,
+					[action for action in actions if action.to_pile == DISCARD])
+		return values
+
+	def _score_discards(self, state, actions):
+		" Score discards from the hand "
+		weights = self.weights
+		myself = state.get_player()
+		center_values = [len(pile) for pile in state.center_stacks]
+		pay_off_value = myself[PAY_OFF][-1] >> RANK_SHIFT
+		hand_values = numpy.array([card >> RANK_SHIFT for card in myself[HAND]])
+		card_values = numpy.array([action.card >> RANK_SHIFT for action in actions])
+		to_ids = numpy.array([action.to_id for action in actions])
+
+		# top two cards of the discard piles, 0 for no card
+		tops = numpy.zeros(4, dtype=int)
+		seconds = numpy.zeros(4, dtype=int)
+		lengths = numpy.array([len(pile) for pile in myself[DISCARD]])
+		for i, pile in enumerate(myself[DISCARD]):
+			if len(pile):
+				tops[i] = pile[-1] >> RANK_SHIFT
+			if len(pile) > 1:
+				seconds[i] = pile[-2] >> RANK_SHIFT
+
+		values = numpy.zeros(len(actions), dtype=int) + weights.discard
+		values += numpy.where(lengths[to_ids] == 0, weights.discard_on_empty, 0)
+		values += numpy.where((lengths[to_ids] > 0) & (tops[to_ids] == card_values),
+				weights.discard_on_same, 0)
+		# the discarded card is no longer in the hand
+		values += weights.discard_common_in_hand * \
+				((hand_values[:, None] == card_values).sum(axis=0) - 1)
+
+		# center stacks from closest to furthest from the pay off card, see
+		# ComputerPlayer._find_least_essential_card
+		ordered = sorted(center_values, key=DISTANCE[pay_off_value].__getitem__, reverse=True)
+		masks = self.between[pay_off_value][ordered[::-1]]
+
+		# the discarded card and the rest of the hand have the same values as the hand
+		cards = numpy.bitwise_or.reduce(1 << hand_values)
+		for mask in masks:
+			if cards & ~mask:
+				cards &= ~mask
+		values += numpy.where((cards >> card_values) & 1, weights.discard_least_essential, 0)
+
+		# values of the discard piles as _build_pre_play_discard_piles sees them
+		# after the discard
+		after_lengths = numpy.tile(lengths, (len(actions), 1))
+		after_lengths[numpy.arange(len(actions)), to_ids] += 1
+		piles = numpy.tile(seconds, (len(actions), 1))
+		piles[to_ids == 0] = tops
+		piles[numpy.arange(len(actions)), to_ids] = numpy.where(to_ids == 0, card_values, tops[to_ids])
+		piles[after_lengths < 2] = 0
+
+		pile_cards = numpy.bitwise_or.reduce(1 << piles, axis=1)
+		for mask in masks:
+			remaining = pile_cards & ~mask
+			pile_cards = numpy.where(remaining != 0, remaining, pile_cards)
+		least = ((pile_cards[:, None] >> piles) & 1).argmax(axis=1)
+		values += numpy.where(least == to_ids, weights.discard_bury_least, 0)
+		return values
@@ -5,6 +5,7 @@
 import pygame 
 from pygame.locals import *
 from cardmodels import Suits, Card
+import os
 import logging
 
 log = logging.getLogger('snm.cardview')
@@ -18,9 +19,10 @@ class CardView(object):
 		self.model = model
 
 	def place(self, surface, rect):
-		" Blit the card onto the surface, and save the location "
+		" Blit the card onto the surface, if there is one, and save the location "
 		self.loc = rect
-		surface.blit(self.surface, rect)
+		if surface:
+			surface.blit(self.surface, rect)
 
 	def getLocRect(self):
 		pass
@@ -33,23 +35,87 @@ class CardView(object):
 
 
 class CardImages(object):
-	" A Factory for CardView objects "
+	"""
+	A Factory for CardView objects. The card images are loaded once per process
+	into a single surface, the atlas, and each card is a subsurface of it, so
+	cards share its pixels.
+	"""
 
 	image_dir = './media/cards'
+	# if set, the atlas is saved to this file as raw pixels, and loaded from it
+	# instead of the images when it exists
+	atlas_file = None
 	
+	atlas = None
 	cardImages = {}
 	backImage = None
 	blankImage = None
 	suit_to_let = {Suits.SPADE: 's', Suits.CLUB: 'c', Suits.DIAMOND: 'd', Suits.HEART: 'h'}
 
 	def __init__(self):
-		for suit in self.suit_to_let.keys():
+		if not CardImages.atlas:
+			CardImages.load()
+
+	@classmethod
+	def image_names(cls):
+		" Return a list of the image files in atlas order, one row per suit then the back and blank "
+		names = []
+		for suit in cls.suits():
+			names.extend(["%s%s.gif" % (value.lower(), cls.suit_to_let[suit]) for value in Card.values])
+		return names + ['b.png', 'blank.gif']
+
+	@classmethod
+	def suits(cls):
+		" The suits in atlas order "
+		return sorted(cls.suit_to_let.keys(), key=cls.suit_to_let.get)
+
+	@classmethod
+	def load(cls):
+		" Build the atlas, or load it from atlas_file, and make the card surfaces "
+		if cls.atlas_file and os.path.exists(cls.atlas_file):
+			cls.atlas = cls._read_atlas(cls.atlas_file)
+		else:
+			cls.atlas = cls._build_atlas()
+			if cls.atlas_file:
+				cls._write_atlas(cls.atlas, cls.atlas_file)
+
+		# cut the atlas into the card images
+		width = cls.atlas.get_width() / len(Card.values)
+		height = cls.atlas.get_height() / (len(cls.suit_to_let) + 1)
+		rects = [pygame.Rect(x * width, y * height, width, height) 
+				for y in range(len(cls.suit_to_let) + 1) for x in range(len(Card.values))]
+		cls.cardImages = {}
+		for suit in cls.suits():
 			for value in Card.values:
-				self.cardImages[value + suit] = pygame.image.load("%s/%s%s.gif" % (
-						self.image_dir, value.lower(), self.suit_to_let[suit])).convert()
-
-		self.backImage = pygame.image.load("%s/b.png" % (self.image_dir))
-		self.blankImage = pygame.image.load("%s/blank.gif" % (self.image_dir))
+				cls.cardImages[value + suit] = cls.atlas.subsurface(rects.pop(0))
+		cls.backImage = cls.atlas.subsurface(rects.pop(0))
+		cls.blankImage = cls.atlas.subsurface(rects.pop(0))
+
+	@classmethod
+	def _build_atlas(cls):
+		" Load the card images, and blit them onto a new atlas surface "
+		images = [pygame.image.load("%s/%s" % (cls.image_dir, name)) for name in cls.image_names()]
+		width, height = images[0].get_size()
+		atlas = pygame.Surface((width * len(Card.values), height * (len(cls.suit_to_let) + 1)),
+				SRCALPHA, 32)
+		for i, image in enumerate(images):
+			atlas.blit(image, ((i % len(Card.values)) * width, (i / len(Card.values)) * height))
+		log.info("Built card atlas from %d images" % len(images))
+		return atlas.convert_alpha()
+
+	@staticmethod
+	def _write_atlas(atlas, filename):
+		" Save the atlas as its size, then raw RGBA pixels "
+		with open(filename, 'wb') as out:
+			out.write("%d %d\n" % atlas.get_size())
+			out.write(pygame.image.tostring(atlas, 'RGBA'))
+
+	@staticmethod
+	def _read_atlas(filename):
+		" Load an atlas saved by _write_atlas "
+		with open(filename, 'rb') as data:
+			size = tuple(map(int, data.readline().split()))
+			return pygame.image.fromstring(data.read(), size, 'RGBA').convert_alpha()
 
 	def getCard(self, card):
 		" get a cards image "
@@ -61,6 +127,7 @@ class CardImages(object):
 	def getBlank(self):
 		return CardView(self.blankImage, None)
 
+
 class CardGroup(list):
 	" A group of cards to capture clicks "
 
@@ -92,7 +159,7 @@ class CardGroup(list):
 		" Find if the click was on a card in this CardGroup "
 		for index in range(len(self)-1,-1,-1):
 			rect = self[index][0].loc
-			log.debug("index[%s] card(%s) mouse(%s,%s)" % (index, rect, event.pos[0], event.pos[1]))
+			log.debug("index[%s] card(%s) mouse(%s,%s)", index, rect, event.pos[0], event.pos[1])
 			if rect.collidepoint(event.pos[0], event.pos[1]):
 			 	self.selected_id = index
 				return True
@@ -5,7 +5,15 @@
 """
 
 import random
+from array import array
+from collections import deque
+from copy import copy
+from itertools import islice
 
+# Cards can be packed into small ints, with the rank in the high bits and the
+# suit in the low bits.  0 is not a card.
+RANK_SHIFT = 2
+SUIT_MASK = 3
 
 
 class Suits:
@@ -20,6 +28,11 @@ class Suits:
 class Card:
 	" Class to verify that a card is valid "
 	values = "A234567890JQK"
+	suits = (Suits.HEART, Suits.DIAMOND, Suits.CLUB, Suits.SPADE)
+
+	# lookup tables between the string and packed forms, see below
+	_codes = {}
+	_cards = [None] * (15 << RANK_SHIFT)
 
 	@staticmethod
 	def is_valid(card):
@@ -52,15 +65,58 @@ class Card:
 			return 14
 		return int(value)
 
+	@staticmethod
+	def encode(card):
+		" convert a card to its packed int form "
+		return Card._codes[card]
+
+	@staticmethod
+	def decode(code):
+		" convert a packed card back to its string form "
+		return Card._cards[code]
+
+	@staticmethod
+	def rank(code):
+		" the numeric value of a packed card "
+		return code >> RANK_SHIFT
+
+	@staticmethod
+	def is_valid_code(code):
+		" Check if a packed card represents a real card "
+		return 0 < code >> RANK_SHIFT <= len(Card.values)
+
+	@staticmethod
+	def encode_pile(cards):
+		" pack a list of cards into an array "
+		return array('B', [Card._codes[card] for card in cards])
+
+	@staticmethod
+	def decode_pile(codes):
+		" unpack an array of cards into a list of strings "
+		return [Card._cards[code] for code in codes]
+
+def _build_card_codes():
+	" build the packed card lookup tables, jokers included "
+	for rank, value in enumerate(Card.values + 'O'):
+		for suit_id, suit in enumerate(Card.suits):
+			code = (rank + 1) << RANK_SHIFT | suit_id
+			# some suits share a symbol, keep the first code for them
+			Card._codes.setdefault(value + suit, code)
+			Card._cards[code] = value + suit
+_build_card_codes()
+
+
 class Deck(list):
 	"""
 	A deck of cards. Has the following actions:
-	Deck(num_packs=1, jokers=False) - pack is 52 cards, jokers to include them
+	Deck(num_packs=1, jokers=False, rng=None) - pack is 52 cards, jokers to include
+	them, rng is the random.Random to shuffle with, the random module if None
 	shuffle() - shuffles the pack
 	"""
-	def __init__(self, num_packs=1, jokers=False):
+	def __init__(self, num_packs=1, jokers=False, rng=None):
 		" create the deck of cards "
 		list.__init__(self)
+		self.rng = rng
 		for pack in range(num_packs):
 			for suit in [Suits.HEART, Suits.DIAMOND, Suits.CLUB, Suits.SPADE]:
 				values = Card.values
@@ -76,20 +132,40 @@ class Deck(list):
 
 	def shuffle(self):
 		" shuffle the deck(s) of cards "
-		random.shuffle(self)
+		(self.rng or random).shuffle(self)
 
 
-class Pile(Deck):
+class Pile(deque):
 	"""
-	A pile of cards. Some can be visible.
+	A pile of cards. Some can be visible. Cards are drawn and added at the top
+	or bottom in constant time. A random card is swapped with the top one and
+	drawn. Finding it takes a step for each 64 cards between it and the 
+	nearest end, so it is linear, but one or two steps for the piles of a game.
+	rng is the random.Random to shuffle and draw random cards with, the random
+	module if None.
 	"""
 	TOP = "top"
 	BOTTOM = "bottom"
 	RANDOM = "random"
 
-	def __init__(self, cards):
-		list.__init__(self, cards)
+	def __init__(self, cards=(), rng=None):
+		deque.__init__(self, cards)
 		self.visible_index = None
+		self.rng = rng
+		# cards packed into an array, until the pile changes
+		self._packed = None
+
+	def __reduce__(self):
+		# deque passes a maxlen to the constructor, which piles don't take. The
+		# attributes are the state, so deepcopy and pickle keep a copy of rng.
+		return (self.__class__, (list(self),), dict(self.__dict__, _packed=None))
+
+	def __copy__(self):
+		# the copy gets its own rng in the same state, so it draws the same cards
+		# as the pile would, without changing the cards the pile will draw
+		pile = self.__class__(self, copy(self.rng))
+		pile.visible_index = self.visible_index
+		return pile
 
 	def draw(self, num=1, cards_from="top"):
 		" Draw a card from the pile "
@@ -100,11 +176,12 @@ class Pile(Deck):
 			if cards_from == Pile.TOP:
 				cards.append(self.pop())
 			elif cards_from == Pile.BOTTOM:
-				cards.append(self.pop(0))
+				cards.append(self.popleft())
 			elif cards_from == Pile.RANDOM:
-				card = random.choice(self)
-				self.remove(card)
-				cards.append(card)
+				# swap the card with the top one, so it can be popped
+				index = int((self.rng or random).random() * len(self))
+				self[index], self[-1] = self[-1], self[index]
+				cards.append(self.pop())
 		return cards
 
 	def add_cards(self, cards, cards_to="bottom"):
@@ -112,18 +189,46 @@ class Pile(Deck):
 		if cards_to == Pile.TOP:
 			self.extend(cards)
 		elif cards_to == Pile.BOTTOM:
-			current_pile = list(self)
-			self[:] = cards
-			self.extend(current_pile)
+			self.extendleft(reversed(cards))
 		elif cards_to == Pile.RANDOM:
 			#TODO: 
 			self.extend(cards)
-				
+
+	def shuffle(self):
+		" shuffle the cards of the pile "
+		(self.rng or random).shuffle(self)
+
+	def index(self, card):
+		" Return the position of the first card equal to card, from the bottom "
+		for i, pile_card in enumerate(self):
+			if pile_card == card:
+				return i
+		raise ValueError("%s is not in the pile" % card)
+
+	def insert(self, index, card):
+		" Insert card at position index, from the bottom "
+		self.rotate(-index)
+		self.appendleft(card)
+		self.rotate(index)
+
+	def packed(self):
+		"""
+		Return the cards packed into an array (see Card.encode_pile). The array
+		is kept and returned again until the pile changes, so it must not be
+		changed.
+		"""
+		if self._packed is None:
+			self._packed = Card.encode_pile(self)
+		return self._packed
+
 	def visible(self):
 		" return the list of visible cards "
 		if self.visible_index == None:
 			return []
-		return self[self.visible_index:]
+		start = self.visible_index
+		if start < 0:
+			start = max(len(self) + start, 0)
+		return list(islice(self, start, None))
 
 	def flip(self, num_cards=1, all=False):
 		" set this number of cards to the visible state "
@@ -144,3 +249,15 @@ class Pile(Deck):
 		return "xx " * (len(self) + visible) + " ".join(self.visible())
 
 
+def _changes_pile(method):
+	" Wrap a deque method that changes the pile, so the packed array is dropped "
+	def change(self, *args):
+		self._packed = None
+		return method(self, *args)
+	change.__name__ = method.__name__
+	change.__doc__ = method.__doc__
+	return change
+
+for _name in ('append', 'appendleft', 'extend', 'extendleft', 'pop', 'popleft',
+		'remove', 'rotate', 'clear', '__setitem__', '__delitem__', '__iadd__'):
+	setattr(Pile, _name, _changes_pile(getattr(deque, _name)))
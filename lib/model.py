@@ -3,8 +3,10 @@
  Limits the moves to only those that are possible according to the rules.
 """
 
-from cardmodels import Deck, Pile, Card
-from copy import deepcopy
+from cardmodels import Deck, Pile, Card, RANK_SHIFT
+from array import array
+from bisect import insort
+import random
 import logging
 
 log = logging.getLogger('snm.model')
@@ -15,6 +17,38 @@ DISCARD = 'discard'
 CENTER = 'center'
 
 
+# Keys for zobrist hashing of the visible state. Each card in a pile has a
+# random key for its position and card code, at index (position << 6 | code).
+# The keys are added together, so duplicate cards don't cancel each other out.
+ZOBRIST_MASK = (1 << 64) - 1
+_zobrist_random = random.Random(0x5317e)
+
+def _zobrist_keys(num):
+	return [_zobrist_random.getrandbits(64) for i in range(num)]
+
+def _zobrist_player_keys():
+	" keys for the piles of one player "
+	return {
+		HAND: _zobrist_keys(5 << 6),
+		PAY_OFF: _zobrist_keys(1 << 6),
+		DISCARD: [_zobrist_keys(104 << 6) for i in range(4)],
+	}
+
+ZOBRIST_PILES = [_zobrist_player_keys(), _zobrist_player_keys()]
+# center stacks only count by length, so any stacks with the same lengths are equal
+ZOBRIST_CENTER = _zobrist_keys(105)
+ZOBRIST_ACTIVE = _zobrist_keys(2)
+
+# the longest a center stack can be, all the cards of both packs
+MAX_CENTER_LENGTH = 104
+KING = 13
+
+# CENTER_PLAYABLE[rank][length] is True if a card of rank can be played on a
+# center stack of length. Kings go anywhere, other cards on the stack one shorter.
+CENTER_PLAYABLE = [[rank == KING or rank == length + 1
+		for length in range(MAX_CENTER_LENGTH + 1)] for rank in range(KING + 1)]
+
+
 class InvalidMove(ValueError): 
 	" thrown when a player attempts an invalid move "
 	pass
@@ -47,13 +81,16 @@ class PlayerMove(object):
 
 	def __str__(self):
 		" String representation of this dto "
+		card = self.card
+		if isinstance(card, int):
+			card = Card.decode(card)
 		from_id = self.from_id
 		to_id = self.to_id
 		if self.from_id == None or self.from_pile in [HAND, PAY_OFF]:
 			from_id = ''
 		if self.to_id == None:
 			to_id = ''
-		return "Move(%s %s[%s] -> %s %s)" % (self.from_pile, from_id, self.card,
+		return "Move(%s %s[%s] -> %s %s)" % (self.from_pile, from_id, card,
 				self.to_pile, to_id)
 
 	def __eq__(self, other):
@@ -77,25 +114,40 @@ class SpiteAndMaliceModel(object):
 	NUM_STACKS = 4
 	HAND_SIZE = 5
 
-	def __init__(self):
-		" Initialize the game to a starting state "
+	__slots__ = ('active_player', 'players', 'stock', 'center_stacks', 'undo_stack', 'zobrist',
+			'rng')
+
+	# how the cards in the piles of this model are checked
+	is_valid_card = staticmethod(Card.is_valid)
+	card_rank = staticmethod(Card.to_numeric_value)
+	card_code = staticmethod(Card.encode)
+
+	def __init__(self, rng=None):
+		"""
+		Initialize the game to a starting state. rng is the random.Random the
+		cards are shuffled with, the random module if None. Give each game its
+		own to deal and play it the same way again.
+		"""
+		self.rng = rng
 		# shuffle two packs together
-		all_cards = Pile(Deck(num_packs=2))
+		all_cards = Pile(Deck(num_packs=2, rng=rng), rng=rng)
 
 		# id of the active player
 		self.active_player = None
 		self.players = [{}, {}]
+		# moves that can be reversed with undo_move
+		self.undo_stack = []
 		for player in self.players:
 			# deal 20 cards to each players pay-off pile
-			player[PAY_OFF] = Pile(all_cards.draw(num=20))
+			player[PAY_OFF] = Pile(all_cards.draw(num=20), rng=rng)
 			player[PAY_OFF].flip()
 			# deal 5 cards to each players hard
-			player[HAND] = Pile(all_cards.draw(num=self.HAND_SIZE))
+			player[HAND] = Pile(all_cards.draw(num=self.HAND_SIZE), rng=rng)
 			player[HAND].flip(all=True)
 			# four discard stacks
 			player[DISCARD] = []
 			for i in range(self.NUM_STACKS):
-				pile = Pile([])
+				pile = Pile([], rng=rng)
 				pile.flip(all=True)
 				player[DISCARD].append(pile)
 
@@ -105,10 +157,51 @@ class SpiteAndMaliceModel(object):
 		# create 4 empty center stacks
 		self.center_stacks = []
 		for i in range(self.NUM_STACKS):
-			pile = Pile([])
+			pile = Pile([], rng=rng)
 			pile.flip(all=True)
 			self.center_stacks.append(pile)
 
+		self.zobrist = self._compute_zobrist()
+
+
+	def _hash_pile(self, keys, pile, start=0):
+		" Sum of the zobrist keys for the cards in pile from position start "
+		card_code = self.card_code
+		value = 0
+		for position in range(start, len(pile)):
+			value += keys[position << 6 | card_code(pile[position])]
+		return value
+
+	def _compute_zobrist(self):
+		"""
+		Compute the zobrist hash of the visible piles from scratch. After this
+		it is kept up to date by the methods that move cards.
+		"""
+		value = 0
+		for player_id in range(len(self.players)):
+			player = self.players[player_id]
+			keys = ZOBRIST_PILES[player_id]
+			value += self._hash_pile(keys[HAND], player[HAND])
+			if len(player[PAY_OFF]):
+				value += keys[PAY_OFF][self.card_code(player[PAY_OFF][-1])]
+			for pile_id in range(len(player[DISCARD])):
+				value += self._hash_pile(keys[DISCARD][pile_id], player[DISCARD][pile_id])
+		for pile in self.center_stacks:
+			value += ZOBRIST_CENTER[len(pile)]
+		return value & ZOBRIST_MASK
+
+	def zobrist_hash(self):
+		"""
+		Return the hash of the visible state. The active player is only added
+		here, so swapping players or setting active_player needs no update.
+		"""
+		return (self.zobrist + ZOBRIST_ACTIVE[self.active_player or 0]) & ZOBRIST_MASK
+
+
+	def _writable(self, piles, key):
+		" Return the pile piles[key], before it is changed "
+		return piles[key]
+
 
 	def swap_players(self):
 		" Change the active players "
@@ -155,7 +248,7 @@ class SpiteAndMaliceModel(object):
 		Returns the id of the player who gets to play next.
 		"""
 		card = player_move.card
-		if not Card.is_valid(card):
+		if not self.is_valid_card(card):
 			raise InvalidMove("Unknown card %s." % (card))
 		if player_move.from_pile not in (HAND, DISCARD, PAY_OFF):
 			raise InvalidMove("from_location incorrect: %s " % (player_move.from_pile))
@@ -167,7 +260,7 @@ class SpiteAndMaliceModel(object):
 			raise InvalidMove("Can not place card(%s) on center stack %s." % (card, player_move.to_id))
 		
 		# can not discard kings
-		if card[0] == 'K' and player_move.to_pile == DISCARD:
+		if self.card_rank(card) == 13 and player_move.to_pile == DISCARD:
 			raise InvalidMove("Can not DISCARD card(%s)" % (card))
 
 		# can not move from discard to discard
@@ -176,78 +269,347 @@ class SpiteAndMaliceModel(object):
 
 		# remove it from old location
 		player = self.players[self.active_player]
+		keys = ZOBRIST_PILES[self.active_player]
 		if player_move.from_pile == HAND and card in player[HAND]:
-			player[HAND].remove(card)
+			from_pile = self._writable(player, HAND)
+			from_keys = keys[HAND]
+			from_index = from_pile.index(card)
 		elif player_move.from_pile == DISCARD and card in player[DISCARD][player_move.from_id]:
-			player[DISCARD][player_move.from_id].remove(card)
+			from_pile = self._writable(player[DISCARD], player_move.from_id)
+			from_keys = keys[DISCARD][player_move.from_id]
+			from_index = from_pile.index(card)
 		elif player_move.from_pile == PAY_OFF and card == player[PAY_OFF][-1]:
 			if player_move.to_pile != CENTER:
 				raise InvalidMove("Can not move PAY_OFF to %s" % player_move.to_pile)
-			else:
-				player[PAY_OFF].pop()
+			from_pile = self._writable(player, PAY_OFF)
+			from_index = len(from_pile) - 1
 		else:
 			raise InvalidMove("Could not find card(%s) in %s." % (card, player_move.from_pile))
 
+		# remember where the card came from so the move can be reversed
+		self.undo_stack.append((player_move, self.active_player, from_index, self.zobrist))
+
+		# cards above the removed one change position
+		zobrist = self.zobrist
+		if player_move.from_pile == PAY_OFF:
+			zobrist -= keys[PAY_OFF][self.card_code(card)]
+			del from_pile[from_index]
+			if len(from_pile):
+				zobrist += keys[PAY_OFF][self.card_code(from_pile[-1])]
+		else:
+			zobrist -= self._hash_pile(from_keys, from_pile, from_index)
+			del from_pile[from_index]
+			zobrist += self._hash_pile(from_keys, from_pile, from_index)
+
 		# place it in new location
 		if player_move.to_pile == CENTER:
-			self.center_stacks[player_move.to_id].append(card)
+			pile = self._writable(self.center_stacks, player_move.to_id)
+			zobrist += ZOBRIST_CENTER[len(pile) + 1] - ZOBRIST_CENTER[len(pile)]
+			pile.append(card)
 		elif player_move.to_pile == DISCARD:
-			player[DISCARD][player_move.to_id].append(card)
+			pile = self._writable(player[DISCARD], player_move.to_id)
+			zobrist += keys[DISCARD][player_move.to_id][len(pile) << 6 | self.card_code(card)]
+			pile.append(card)
+		self.zobrist = zobrist & ZOBRIST_MASK
+
+
+	def undo_move(self):
+		"""
+		Reverse the last move made with place_card. The card is put back in the
+		exact position it was taken from, so the state is the same as before the
+		move. Players swapped after a move must be swapped back before it is 
+		undone. fill_hand and mix_into_stock can't be undone, and clear the
+		moves, so a game only keeps the moves of the current turn.
+
+		Returns the PlayerMove that was undone.
+		"""
+		player_move, player_id, from_index, self.zobrist = self.undo_stack.pop()
+		player = self.players[player_id]
+
+		# take it off the new location
+		if player_move.to_pile == CENTER:
+			card = self._writable(self.center_stacks, player_move.to_id).pop()
+		else:
+			card = self._writable(player[DISCARD], player_move.to_id).pop()
+
+		# and put it back where it came from
+		if player_move.from_pile == DISCARD:
+			self._writable(player[DISCARD], player_move.from_id).insert(from_index, card)
+		else:
+			self._writable(player, player_move.from_pile).insert(from_index, card)
+		return player_move
 
 
-	def mix_into_stock(self):
+	def mix_into_stock(self, order=None):
 		""" 
 		Search each of the center stacks for completion, and re-add the completed 
-		center pile into the bottom of the stock.
+		center pile into the bottom of the stock. Returns the list of cards added
+		to the stock, in the order they were added. If order is such a list, the
+		cards are added in its order instead of shuffled, to replay a game.
 		"""
+		del self.undo_stack[:]
+		mixed = []
 		for pile in self.center_stacks:
 			if len(pile) == 12:
-				pile.shuffle()
-				self.stock.add_cards(pile.draw(num=12), cards_to=Pile.BOTTOM)
+				if order is None:
+					pile.shuffle()
+					cards = pile.draw(num=12)
+				else:
+					cards = order[len(mixed):len(mixed) + 12]
+					if sorted(cards) != sorted(pile):
+						raise ValueError("Can not mix %s into the stock, the center stack is %s" % (
+								" ".join(cards), " ".join(pile)))
+					pile.clear()
+				self.stock.add_cards(cards, cards_to=Pile.BOTTOM)
+				mixed.extend(cards)
+				self.zobrist = (self.zobrist + ZOBRIST_CENTER[0] - ZOBRIST_CENTER[12]) & ZOBRIST_MASK
+		return mixed
 
 
 	def fill_hand(self):
 		" Fill the active players hand "
+		del self.undo_stack[:]
 		hand = self.players[self.active_player][HAND]
+		keys = ZOBRIST_PILES[self.active_player][HAND]
 		num_cards = self.HAND_SIZE - len(hand)
+		zobrist = self.zobrist - self._hash_pile(keys, hand)
 		hand.add_cards(self.stock.draw(num=num_cards))
+		self.zobrist = (zobrist + self._hash_pile(keys, hand)) & ZOBRIST_MASK
 
 	def is_won(self):
 		" Check if the game has been won "
 		return (len(self.players[self.active_player][PAY_OFF]) == 0)
 
+	def complete_move(self, player_move, mix_order=None):
+		"""
+		Update the model after a move has been placed: mix completed center
+		stacks into the stock, fill an emptied hand, and after a discard start
+		the other players turn. Returns the cards mixed into the stock, see 
+		mix_into_stock, which is passed mix_order.
+		"""
+		mixed = self.mix_into_stock(mix_order)
+
+		# fill player hand if empty, and not a discard
+		if player_move.to_pile != DISCARD and len(self.get_player()[HAND]) == 0:
+			self.fill_hand()
+
+		# swap players if move was a discard
+		if player_move.to_pile == DISCARD:
+			self.swap_players()
+			self.fill_hand()
+		return mixed
+
 
 
 class GameState(SpiteAndMaliceModel):
-	" A copy of the visible game state for a player "
+	"""
+	A copy of the visible game state for a player. Cards are packed into
+	ints (see Card.encode), and each pile is an array of them.
+
+	Piles are copied on write. The arrays of the game's piles, and of the
+	state a snapshot was taken from, are shared until a move changes them.
+
+	center_targets[rank] is a tuple of the center stacks a card of rank can be
+	played on, the first stack of each length, in the order of the stacks. It
+	is kept up to date as cards are moved to and from the center stacks.
+	"""
+
+	# shared_piles are the ids of the piles this state shares, which are copied
+	# before a change. center_index maps a length to the ids of the center 
+	# stacks of that length, in order.
+	__slots__ = ('shared_piles', 'center_index', 'center_targets')
+
+	is_valid_card = staticmethod(Card.is_valid_code)
+	card_rank = staticmethod(Card.rank)
+	# cards are already packed, so the card is its own code
+	card_code = staticmethod(int)
+
 	def __init__(self, game):
 		self.active_player = game.active_player
 		self.players = [{}, {}]
+		self.undo_stack = []
 
 		# copy of the visible cards for player
 		a_id = self.active_player
 		self.players[a_id] = {
-			HAND: deepcopy(game.players[a_id][HAND]),
-			PAY_OFF: [game.players[a_id][PAY_OFF].visible()[-1]],
-			DISCARD: deepcopy(game.players[a_id][DISCARD]),
+			HAND: game.players[a_id][HAND].packed(),
+			PAY_OFF: Card.encode_pile(game.players[a_id][PAY_OFF].visible()[-1:]),
+			DISCARD: [pile.packed() for pile in game.players[a_id][DISCARD]],
 		}
 		# copy of visible cards of his opponent
 		o_id = int(not a_id)
 		self.players[o_id] = {
-			PAY_OFF: [game.players[o_id][PAY_OFF].visible()[-1]],
-			DISCARD: deepcopy(game.players[o_id][DISCARD]),
-			HAND: []
+			PAY_OFF: Card.encode_pile(game.players[o_id][PAY_OFF].visible()[-1:]),
+			DISCARD: [pile.packed() for pile in game.players[o_id][DISCARD]],
+			HAND: Card.encode_pile([]),
 		}
 		# center stacks
-		self.center_stacks = deepcopy(game.center_stacks)
+		self.center_stacks = [pile.packed() for pile in game.center_stacks]
+		self.shared_piles = set(map(id, self._piles()))
+		self.zobrist = self._compute_zobrist()
+		self._build_center_index()
+
+	def _build_center_index(self):
+		" Build center_index and center_targets from the center stacks "
+		self.center_index = {}
+		for center_id in range(len(self.center_stacks)):
+			self.center_index.setdefault(len(self.center_stacks[center_id]), []).append(center_id)
+		self.center_targets = [()] * (KING + 1)
+		self._update_center_targets(range(1, KING + 1))
+
+	def _update_center_targets(self, ranks):
+		"""
+		Update center_targets for ranks, from center_index. As in CENTER_PLAYABLE,
+		kings go on a stack of each length, and other ranks on the stacks one
+		shorter than the rank.
+		"""
+		index = self.center_index
+		for rank in ranks:
+			if rank == KING:
+				self.center_targets[rank] = tuple(sorted([ids[0] for ids in index.itervalues()]))
+			elif rank - 1 in index:
+				self.center_targets[rank] = (index[rank - 1][0],)
+			else:
+				self.center_targets[rank] = ()
+
+	def _move_center(self, center_id, change):
+		"""
+		Update the center index after the length of a center stack changed by
+		change. Only the cards that could be played on the old or new length
+		can be played somewhere else.
+		"""
+		index = self.center_index
+		length = len(self.center_stacks[center_id])
+		old_length = length - change
+		ids = index[old_length]
+		if len(ids) == 1:
+			del index[old_length]
+		else:
+			ids.remove(center_id)
+		if length in index:
+			insort(index[length], center_id)
+		else:
+			index[length] = [center_id]
+		ranks = [KING]
+		for rank in (old_length + 1, length + 1):
+			if rank < KING:
+				ranks.append(rank)
+		self._update_center_targets(ranks)
+
+	def place_card(self, player_move):
+		" Same as SpiteAndMaliceModel.place_card, keeping the center index up to date "
+		SpiteAndMaliceModel.place_card(self, player_move)
+		if player_move.to_pile == CENTER:
+			self._move_center(player_move.to_id, 1)
+
+	def undo_move(self):
+		" Same as SpiteAndMaliceModel.undo_move, keeping the center index up to date "
+		player_move = SpiteAndMaliceModel.undo_move(self)
+		if player_move.to_pile == CENTER:
+			self._move_center(player_move.to_id, -1)
+		return player_move
+
+	def _piles(self):
+		" Return all the piles of the state "
+		piles = list(self.center_stacks)
+		for player in self.players:
+			piles.append(player[HAND])
+			piles.append(player[PAY_OFF])
+			piles.extend(player[DISCARD])
+		return piles
+
+	def _writable(self, piles, key):
+		" Return the pile piles[key], copied first if it is shared "
+		pile = piles[key]
+		if id(pile) in self.shared_piles:
+			self.shared_piles.discard(id(pile))
+			pile = piles[key] = array('B', pile)
+		return pile
+
+	def snapshot(self):
+		"""
+		Return a copy of the state. The copy shares the piles with this state,
+		so it takes time for the number of piles, not the number of cards.
+		"""
+		state = GameState.__new__(GameState)
+		state.active_player = self.active_player
+		state.players = [dict(player, **{DISCARD: list(player[DISCARD])})
+				for player in self.players]
+		state.center_stacks = list(self.center_stacks)
+		state.undo_stack = list(self.undo_stack)
+		state.zobrist = self.zobrist
+		state.center_index = dict((length, list(ids))
+				for length, ids in self.center_index.iteritems())
+		state.center_targets = list(self.center_targets)
+		# neither state can change the piles now
+		self.shared_piles = set(map(id, self._piles()))
+		state.shared_piles = set(self.shared_piles)
+		return state
+
+	def view_for_other_player(self, hand):
+		"""
+		Return a snapshot of the state for the other player, starting their turn
+		with hand, an array of packed cards. The hand of the active player is
+		hidden, as it is in the states the game builds for the other player.
+		"""
+		state = self.snapshot()
+		state.undo_stack = []
+		player_id = self.active_player
+		other_id = int(not player_id)
+		zobrist = state.zobrist
+		for pile_owner, cards in ((player_id, array('B')), (other_id, array('B', hand))):
+			keys = ZOBRIST_PILES[pile_owner][HAND]
+			zobrist += self._hash_pile(keys, cards) - self._hash_pile(keys,
+					state.players[pile_owner][HAND])
+			state.players[pile_owner][HAND] = cards
+		state.zobrist = zobrist & ZOBRIST_MASK
+		state.active_player = other_id
+		return state
+
+	def to_dict(self):
+		" Return the state as a dict of lists of card strings, that can be saved as json "
+		def player_dict(player):
+			return {
+				HAND: Card.decode_pile(player[HAND]),
+				PAY_OFF: Card.decode_pile(player[PAY_OFF]),
+				DISCARD: map(Card.decode_pile, player[DISCARD]),
+			}
+		return {
+			'active_player': self.active_player,
+			'players': map(player_dict, self.players),
+			'center_stacks': map(Card.decode_pile, self.center_stacks),
+		}
+
+	@classmethod
+	def from_dict(cls, data):
+		" Build a state from a dict returned by to_dict "
+		state = cls.__new__(cls)
+		state.active_player = data['active_player']
+		state.players = [{
+			HAND: Card.encode_pile(player[HAND]),
+			PAY_OFF: Card.encode_pile(player[PAY_OFF]),
+			DISCARD: map(Card.encode_pile, player[DISCARD]),
+		} for player in data['players']]
+		state.center_stacks = map(Card.encode_pile, data['center_stacks'])
+		state.undo_stack = []
+		state.shared_piles = set()
+		state.zobrist = state._compute_zobrist()
+		state._build_center_index()
+		return state
+
+	@classmethod
+	def can_place_card_in_center(cls, pile, card):
+		" Same as SpiteAndMaliceModel.can_place_card_in_center for a packed card "
+		return CENTER_PLAYABLE[card >> RANK_SHIFT][len(pile)]
 
 	def __eq__(self, other):
+		" States are equal if their visible cards are, center stacks only by length "
 		if other == None or type(other) != GameState:
 			return False
-		for pile in self.get_player().keys():
-			if self.get_player()[pile] != other.get_player()[pile]:
-				return False
-		return True
+		return self.zobrist_hash() == other.zobrist_hash()
+
+	def __hash__(self):
+		return self.zobrist_hash()
 
 	def __ne__(self, other):
 		return not self.__eq__(other)
@@ -259,22 +621,22 @@ class GameState(SpiteAndMaliceModel):
 		od = []
 		cs = []
 		if len(s[PAY_OFF]):
-			s_po = s[PAY_OFF][-1]
+			s_po = Card.decode(s[PAY_OFF][-1])
 		else:
 			s_po = ''
 		if len(o[PAY_OFF]):
-			o_po = o[PAY_OFF][-1]
+			o_po = Card.decode(o[PAY_OFF][-1])
 		else:
 			o_po = ''
 
 		for p, pd in ((s[DISCARD],sd), (o[DISCARD],od), (self.center_stacks, cs)):
 			for pile in p:
 				if len(pile) > 0:
-					pd.append(pile[-1])
+					pd.append(Card.decode(pile[-1]))
 				else:
 					pd.append('')
-		return "State(po[%s]hand[%s]disc[%s],[%s]disc[%s],center[%s])" % (
-				s_po, ''.join(s[HAND]), ''.join(sd), o_po, ''.join(od), ''.join(cs))
+		return "State(po[%s]hand[%s]disc[%s],[%s]disc[%s],center[%s])" % (s_po,
+				''.join(Card.decode_pile(s[HAND])), ''.join(sd), o_po, ''.join(od), ''.join(cs))
 
 	#TODO: make other functions not callable
 
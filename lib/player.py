@@ -3,8 +3,6 @@
  Receives player input from event loops, and builts PlayerMove objects.
 """
 
-import pygame
-from pygame.locals import *
 from model import PlayerMove
 import logging
 
@@ -29,29 +27,32 @@ class Player(object):
 class HumanPlayer(Player):
 	" A human players interface to the game "
 
-	def play_card(self, select_group, target_group):
+	def play_card(self, select_group, target_group, input_queue):
+		" Wait for the player to click a card, and then where to play it "
+		# imported here so that computer players can be used without pygame
+		from pygame.locals import MOUSEBUTTONUP
 		card_selected = False
 		# wait for move selection
 		while True:
-			for event in pygame.event.get():
-				# quit
-				if event.type == QUIT or event.type == KEYDOWN and event.key == K_ESCAPE:
-					return None
-				# mouseclick to select target 
-				if event.type == MOUSEBUTTONUP and card_selected:
-					if target_group.findClick(event):
-						log.info("Selected %s, %s" % target_group.getSelected())
-						card, from_location = select_group.getSelected()
-						to_location = target_group.getSelected()[1]
-						return PlayerMove(card.model, from_location, to_location)
-
-				# TODO: clear selection 
-				# mouseclick to select card
-				if event.type == MOUSEBUTTONUP:
-					if select_group.findClick(event):
-						card_selected = True
-						log.info("Targeted %s, %s, " % select_group.getSelected())
-						continue
+			event = input_queue.get()
+			# quit
+			if input_queue.is_quit(event):
+				return None
+			# mouseclick to select target 
+			if event.type == MOUSEBUTTONUP and card_selected:
+				if target_group.findClick(event):
+					log.info("Selected %s, %s" % target_group.getSelected())
+					card, from_location = select_group.getSelected()
+					to_location = target_group.getSelected()[1]
+					return PlayerMove(card.model, from_location, to_location)
+
+			# TODO: clear selection 
+			# mouseclick to select card
+			if event.type == MOUSEBUTTONUP:
+				if select_group.findClick(event):
+					card_selected = True
+					log.info("Targeted %s, %s, " % select_group.getSelected())
+					continue
 
 #TODO remote player
 class RemotePlayer(HumanPlayer):
@@ -0,0 +1,206 @@
+"""
+ Game records. A record is written by the controller as a game is played,
+ and has the seed of the game, the deal, and every move. Replay rebuilds the
+ model at any move of a record, without a view, to reproduce a position for
+ a bug report or a benchmark.
+
+ A record is a file with a json value on each line. The first is a dict of
+ the seed, the first player and the deal: the pay off piles and hands of the
+ players and the stock, bottom card first. Then each move is a list of
+ [player, card, from_pile, from_id, to_pile, to_id]. A move that completed a
+ center stack is followed by a dict with the cards that were mixed into the
+ stock, in the order they were added to its bottom. The last line is a dict 
+ of the winner and the number of moves, if the game ended. Records of 
+ version 1 have no mixes.
+
+ usage: snm replay record_file [move]
+"""
+
+from model import SpiteAndMaliceModel, PlayerMove, PAY_OFF, HAND
+from copy import deepcopy
+import random
+import json
+import sys
+import logging
+
+log = logging.getLogger('snm.record')
+
+FORMAT = 'snm-record'
+VERSION = 2
+
+
+def deal(model):
+	" Return the cards of the model that were dealt, as lists of card strings "
+	return {
+		'players': [{PAY_OFF: list(player[PAY_OFF]), HAND: list(player[HAND])}
+				for player in model.players],
+		'stock': list(model.stock),
+	}
+
+
+def redeal(model, cards):
+	" Replace the dealt cards of a new model with cards, a deal returned by deal() "
+	for player, player_cards in zip(model.players, cards['players']):
+		for pile_name in (PAY_OFF, HAND):
+			player[pile_name].clear()
+			player[pile_name].extend(player_cards[pile_name])
+	model.stock.clear()
+	model.stock.extend(cards['stock'])
+	# the cards were replaced, not moved
+	model.zobrist = model._compute_zobrist()
+
+
+class GameRecorder(object):
+	" Writes the record of a game to a file as it is played "
+
+	def __init__(self, out):
+		self.out = out
+
+	def _write(self, value):
+		self.out.write(json.dumps(value, ensure_ascii=False).encode('utf-8') + '\n')
+
+	def start(self, model, seed):
+		" Write the seed and the deal, before the first move "
+		self._write({
+			'format': FORMAT,
+			'version': VERSION,
+			'seed': seed,
+			'first_player': model.active_player,
+			'deal': deal(model),
+		})
+
+	def move(self, player_id, player_move):
+		" Write a move that was placed "
+		self._write([player_id, player_move.card, player_move.from_pile, player_move.from_id,
+				player_move.to_pile, player_move.to_id])
+
+	def mix(self, cards):
+		" Write the cards the last move mixed into the stock, see mix_into_stock "
+		self._write({'mix': cards})
+
+	def end(self, winner, num_moves):
+		" Write the end of the game, and close the file "
+		self._write({'winner': winner, 'moves': num_moves})
+		self.out.close()
+
+
+class GameRecord(object):
+	" A game read from a record file, see read_record "
+
+	def __init__(self, seed, first_player, deal, moves, mixes, version=VERSION,
+			winner=None, ended=False):
+		self.seed = seed
+		self.first_player = first_player
+		self.deal = deal
+		# list of (player id, PlayerMove)
+		self.moves = moves
+		# the cards mixed into the stock after a move, by the index of the move
+		self.mixes = mixes
+		self.version = version
+		self.winner = winner
+		self.ended = ended
+
+
+def read_record(filename):
+	" Read a record file written by GameRecorder "
+	with open(filename) as data:
+		lines = [json.loads(line) for line in data if line.strip()]
+	if not lines or lines[0].get('format') != FORMAT:
+		raise ValueError("%s is not a game record" % filename)
+	if lines[0]['version'] > VERSION:
+		raise ValueError("%s is a newer version of game record" % filename)
+	header = lines[0]
+	moves = []
+	mixes = {}
+	end = None
+	for line in lines[1:]:
+		if isinstance(line, dict):
+			if 'mix' in line:
+				mixes[len(moves) - 1] = line['mix']
+				continue
+			end = line
+			break
+		player_id, card, from_pile, from_id, to_pile, to_id = line
+		moves.append((player_id, PlayerMove(card, from_pile=from_pile, from_id=from_id,
+				to_pile=to_pile, to_id=to_id)))
+	return GameRecord(header['seed'], header['first_player'], header['deal'], moves, mixes,
+			header['version'], end and end['winner'], end is not None)
+
+
+class Replay(object):
+	"""
+	Rebuilds the model of a recorded game at any move. A copy of the model is
+	kept every interval moves, so finding a position replays fewer than 
+	interval moves from the closest copy before it.
+
+	The model is dealt the cards of the record, and completed center stacks
+	are mixed into the stock in the recorded order, so a record can be 
+	replayed after the way cards are shuffled changes. Records of version 1 
+	have no mixes. They are replayed with the random.Random of their seed, 
+	which must still deal the recorded cards, or ValueError is raised.
+	"""
+
+	def __init__(self, record, interval=50):
+		self.record = record
+		self.interval = interval
+		# deal from the seed first, so the rng is in the same state as the rng of
+		# the game was after its deal
+		model = SpiteAndMaliceModel(random.Random(record.seed))
+		self.seed_matches = deal(model) == record.deal
+		if not self.seed_matches:
+			if record.version < 2:
+				raise ValueError("The deal of the record is not the deal of seed %s, and "
+						"the record has no mixes to replay the stock with" % record.seed)
+			log.info("The deal of the record is not the deal of seed %s, replaying "
+					"the recorded deal", record.seed)
+			redeal(model, record.deal)
+		model.active_player = record.first_player
+		# the model after each interval moves
+		self.snapshots = [model]
+
+	def __len__(self):
+		return len(self.record.moves)
+
+	def position(self, num_moves):
+		" Return a copy of the model after num_moves moves "
+		if not 0 <= num_moves <= len(self):
+			raise IndexError("The record has %d moves" % len(self))
+		index = min(num_moves // self.interval, len(self.snapshots) - 1)
+		model = deepcopy(self.snapshots[index])
+		for move_num in range(index * self.interval, num_moves):
+			self._apply(model, move_num)
+			if move_num + 1 == len(self.snapshots) * self.interval:
+				self.snapshots.append(deepcopy(model))
+		return model
+
+	def _apply(self, model, move_num):
+		" Make a move of the record on model, the same way the controller does "
+		player_id, player_move = self.record.moves[move_num]
+		if player_id != model.active_player:
+			raise ValueError("Move %d was made by player %d, but it is the turn of %d" % (
+					move_num, player_id, model.active_player))
+		model.place_card(player_move)
+		if not model.is_won():
+			model.complete_move(player_move, self.record.mixes.get(move_num))
+
+
+def main(args):
+	" Print the position of a record at a move, the last one by default "
+	if not args:
+		print __doc__.strip()
+		return
+	record = read_record(args[0])
+	replay = Replay(record)
+	num_moves = len(replay)
+	if args[1:]:
+		num_moves = int(args[1])
+	model = replay.position(num_moves)
+	print "seed %s, %d moves, winner %s" % (record.seed, len(record.moves), record.winner)
+	print "after move %d, player %d to play:" % (num_moves, model.active_player)
+	print unicode(model.build_view_for_player()).encode('utf-8')
+	if num_moves < len(record.moves):
+		print "next: %s" % unicode(record.moves[num_moves][1]).encode('utf-8')
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,182 @@
+"""
+ Headless simulation of games between computer players. Used to evaluate
+ changes to the agents, without a display.
+
+ usage: snm simulate [options]
+"""
+
+from snm import SpiteAndMalice
+from agent import ComputerPlayer
+from player import Player
+from optparse import OptionParser
+import multiprocessing
+import time
+import json
+import csv
+import sys
+import logging
+
+# players that can be used in a simulation, by name
+AGENTS = {
+	'computer': ComputerPlayer,
+}
+
+# fields of the per game results, in csv column order
+GAME_FIELDS = ['game', 'seed', 'winner', 'turns', 'moves', 'elapsed',
+		'move_time_mean', 'move_time_max', 'searches', 'search_time_mean', 'search_time_max']
+
+
+class TimedPlayer(Player):
+	"""
+	Wraps a player to record how long it takes to choose each move. Moves a
+	ComputerPlayer chose in an earlier search are taken from its play queue in
+	no time, so the moves that were searched for are also timed on their own.
+	"""
+
+	def __init__(self, player):
+		self.player = player
+		self.move_times = []
+		self.search_times = []
+
+	def play_card(self, *args):
+		queued = len(getattr(self.player, 'play_queue', ()))
+		start = time.time()
+		player_move = self.player.play_card(*args)
+		elapsed = time.time() - start
+		self.move_times.append(elapsed)
+		if not queued:
+			self.search_times.append(elapsed)
+		return player_move
+
+
+def play_game(task):
+	"""
+	Play one game between agents. task is a tuple of the game number, the seed
+	for the deal, the names of the agents and the maximum number of moves.
+	Returns a dict of the results.
+	"""
+	game_num, seed, agent_names, max_moves = task
+	players = [TimedPlayer(AGENTS[name]()) for name in agent_names]
+	game = SpiteAndMalice(players, headless=True, seed=seed)
+	start = time.time()
+	try:
+		winner = game.run(max_moves)
+	finally:
+		for player in players:
+			if hasattr(player.player, 'close'):
+				player.player.close()
+
+	move_times = sum([player.move_times for player in players], [])
+	search_times = sum([player.search_times for player in players], [])
+	return {
+		'game': game_num,
+		'seed': seed,
+		'winner': winner,
+		'turns': game.num_turns,
+		'moves': game.num_moves,
+		'elapsed': time.time() - start,
+		'move_time_mean': sum(move_times) / max(len(move_times), 1),
+		'move_time_max': max(move_times or [0]),
+		'searches': len(search_times),
+		'search_time_mean': sum(search_times) / max(len(search_times), 1),
+		'search_time_max': max(search_times or [0]),
+	}
+
+
+def simulate(num_games, agent_names=('computer', 'computer'), seed=0, processes=1,
+		max_moves=2000):
+	"""
+	Play num_games games, and return a dict summarizing the results, and the
+	list of results for each game. Game n has its own random.Random, seeded
+	with seed + n, so results don't depend on the number of processes.
+	"""
+	tasks = [(n, seed + n, agent_names, max_moves) for n in range(num_games)]
+	start = time.time()
+	if processes > 1:
+		pool = multiprocessing.Pool(processes)
+		games = pool.map(play_game, tasks, chunksize=1)
+		pool.close()
+	else:
+		games = map(play_game, tasks)
+	elapsed = time.time() - start
+
+	num_moves = sum(game['moves'] for game in games)
+	num_searches = sum(game['searches'] for game in games)
+	wins = [len([game for game in games if game['winner'] == player_id])
+			for player_id in range(len(agent_names))]
+	summary = {
+		'games': num_games,
+		'agents': list(agent_names),
+		'seed': seed,
+		'processes': processes,
+		'elapsed': elapsed,
+		'games_per_second': num_games / elapsed,
+		'wins': wins,
+		'win_rate': [float(w) / max(num_games, 1) for w in wins],
+		'unfinished': num_games - sum(wins),
+		'average_turns': float(sum(game['turns'] for game in games)) / max(num_games, 1),
+		'average_moves': float(num_moves) / max(num_games, 1),
+		'move_time_mean': sum(game['move_time_mean'] * game['moves'] for game in games) /
+				max(num_moves, 1),
+		'move_time_max': max([game['move_time_max'] for game in games] or [0]),
+		'searches': num_searches,
+		'search_time_mean': sum(game['search_time_mean'] * game['searches'] for game in games) /
+				max(num_searches, 1),
+		'search_time_max': max([game['search_time_max'] for game in games] or [0]),
+	}
+	return summary, games
+
+
+def write_report(summary, games, out, format='json'):
+	" Write the results as json, or as csv with a row for each game "
+	if format == 'csv':
+		writer = csv.DictWriter(out, GAME_FIELDS)
+		writer.writerow(dict(zip(GAME_FIELDS, GAME_FIELDS)))
+		writer.writerows(games)
+	else:
+		summary = dict(summary, results=games)
+		json.dump(summary, out, indent=2, sort_keys=True)
+		out.write('\n')
+
+
+def log_to_stderr():
+	" Move the logging on stdout to stderr, so it doesn't mix with the results "
+	loggers = [logging.getLogger()] + [logger for logger in
+			logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger)]
+	for logger in loggers:
+		for handler in logger.handlers:
+			if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+				handler.stream = sys.stderr
+
+
+def main(args):
+	" Run a simulation from the command line "
+	parser = OptionParser(usage="snm simulate [options]")
+	parser.add_option('-n', '--games', type='int', default=10, help="number of games")
+	parser.add_option('-s', '--seed', type='int', default=0, help="seed of the first game")
+	parser.add_option('-p', '--processes', type='int', default=1,
+			help="number of processes to play games in")
+	parser.add_option('-a', '--agents', default='computer,computer',
+			help="comma separated agents, from: %s" % ', '.join(sorted(AGENTS)))
+	parser.add_option('-m', '--max-moves', type='int', default=2000,
+			help="stop a game after this many moves")
+	parser.add_option('-f', '--format', choices=['json', 'csv'], default='json')
+	parser.add_option('-o', '--output', help="file to write the results to")
+	parser.add_option('-v', '--verbose', action='store_true', help="keep agent logging")
+	options, args = parser.parse_args(args)
+
+	agent_names = options.agents.split(',')
+	for name in agent_names:
+		if name not in AGENTS:
+			parser.error("Unknown agent %s" % name)
+	log_to_stderr()
+	if not options.verbose:
+		logging.getLogger('snm.agent').setLevel(logging.WARN)
+
+	summary, games = simulate(options.games, agent_names, options.seed,
+			options.processes, options.max_moves)
+	if options.output:
+		with open(options.output, 'w') as out:
+			write_report(summary, games, out, options.format)
+	else:
+		write_report(summary, games, sys.stdout, options.format)
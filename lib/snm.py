@@ -2,13 +2,16 @@
  Controller for the game Spite and Malice.
 """
 
-from model import SpiteAndMaliceModel, InvalidMove, DISCARD, PAY_OFF, HAND
-from view import GameView 
+from model import SpiteAndMaliceModel, PlayerMove, InvalidMove, DISCARD, PAY_OFF, HAND
 from cardmodels import Suits, Card
+from copy import copy
+import random
+import sys
 import logging
 import logging.config
 from player import HumanPlayer
 from agent import ComputerPlayer
+from record import GameRecorder
 
 log = logging.getLogger('snm.controller')
 
@@ -16,76 +19,194 @@ log = logging.getLogger('snm.controller')
 class SpiteAndMalice(object):
 	" Controller class for the game "
 
-	def __init__(self):
-		self.model = SpiteAndMaliceModel()
-		self.players = [HumanPlayer(), ComputerPlayer()]
-		self.view = GameView(self.model, self.players)
-
-	def run(self):
-		" Lets go. "
-		# find out which player goes first
+	def __init__(self, players=None, headless=False, move_delay=0.3, seed=None,
+			record=None):
+		"""
+		players defaults to a human against the computer. A headless game has no
+		view, so it can only be played by computer players. move_delay is the 
+		least time, in seconds, the view shows each computer move for.
+
+		If seed is set the game has its own random.Random seeded with it, so it
+		is dealt and played the same way each time, otherwise the cards are
+		shuffled with the random module. If record is a file name, the game is
+		written to it as it is played, see record.py. A recorded game without 
+		a seed is given a random one.
+		"""
+		if record and seed is None:
+			seed = random.randrange(1 << 32)
+		self.seed = seed
+		rng = None
+		if seed is not None:
+			rng = random.Random(seed)
+		self.model = SpiteAndMaliceModel(rng)
+		self.record = record
+		self.players = players or [HumanPlayer(), ComputerPlayer(ponder=True)]
+		self.view = None
+		if not headless:
+			# imported here so headless games don't need pygame
+			from view import GameView
+			self.view = GameView(self.model, self.players, move_delay)
+		# number of moves and turns played
+		self.num_moves = 0
+		self.num_turns = 0
+
+	def choose_first_player(self):
+		" The player with the highest pay off card goes first "
 		if Card.to_numeric_value(self.model.players[0][PAY_OFF][-1]) > \
 				Card.to_numeric_value(self.model.players[1][PAY_OFF][-1]):
 			self.model.active_player = 0
 		else:
 			self.model.active_player = 1
 
+	def run(self, max_moves=None):
+		"""
+		Lets go. Returns the id of the player who won, or None if the game was
+		ended before anyone won, or after max_moves moves.
+		"""
+		self.choose_first_player()
+		if not self.record:
+			return self._play(max_moves)
+
+		recorder = GameRecorder(open(self.record, 'w'))
+		recorder.start(self.model, self.seed)
+		winner = None
+		try:
+			winner = self._play(max_moves, recorder)
+		finally:
+			recorder.end(winner, self.num_moves)
+		return winner
+
+	def _play(self, max_moves, recorder=None):
+		" Play moves until the game is won or ended, see run "
 		prev_active = None
-		while True:
+		while max_moves == None or self.num_moves < max_moves:
 			active_player = self.model.active_player
 			other_player = int(not self.model.active_player)
 
-			# special case for both human players, blank the screen if it's a new players turn
-			if type(self.players[active_player]) == type(self.players[other_player]) \
-					== HumanPlayer and prev_active != active_player:
-				self.view.wait_screen()
+			if self.view:
+				self._draw_view(active_player, other_player, prev_active)
 				prev_active = active_player
 
-			# draw the board for the human player(s)
-			if type(self.players[active_player]) == HumanPlayer:
-				self.view.draw_board(active_player)
-			elif type(self.players[other_player]) == HumanPlayer:
-				self.view.draw_board(other_player)
-
 			# get the next move
 			if type(self.players[active_player]) == HumanPlayer:
+				self._ponder(other_player)
 				player_move = self.players[active_player].play_card(
-						self.view.select_group, self.view.target_group)
+						self.view.select_group, self.view.target_group, self.view.input_queue)
 			else:
 				game_state = self.model.build_view_for_player()
 				player_move = self.players[active_player].play_card(game_state)
+				# give a human time to see the computers moves
+				if self.view:
+					self.view.pace()
 
 			if player_move == None:
 				log.warn('Got None move. Ending')
-				return
+				return None
 
 			# play the move
 			try:
 				self.model.place_card(player_move)
 			except InvalidMove, inv:
-				self.view.show_error(inv)
+				self._show_error(inv)
 				continue
+			self.num_moves += 1
+			if recorder:
+				recorder.move(active_player, player_move)
+
 			# check for win
 			if self.model.is_won():
-				self.view.game_over()
-				return
-			# mix completed stacks back in
-			self.model.mix_into_stock()
-
-			# fill player hand if empty, and not a discard
-			hand = self.model.players[active_player][HAND]
-			if player_move.to_pile != DISCARD and len(hand) == 0:
-				self.model.fill_hand()
-
-			# swap players if move was a discard
-			if player_move.to_pile == DISCARD:
-				# tell view and model to end the round
-				self.model.swap_players()
-				self.model.fill_hand()
+				if self.view:
+					self.view.game_over()
+				return active_player
+			self.complete_move(player_move, recorder)
+		return None
+
+	def complete_move(self, player_move, recorder=None):
+		" Update the model after a move has been placed, recording any mix of the stock "
+		mixed = self.model.complete_move(player_move)
+		if recorder and mixed:
+			recorder.mix(mixed)
+		if player_move.to_pile == DISCARD:
+			self.num_turns += 1
+
+	def _ponder(self, player_id):
+		"""
+		Let a computer player search the states it could start its next turn in
+		while the active player thinks, if it ponders.
+		"""
+		player = self.players[player_id]
+		if isinstance(player, ComputerPlayer) and player.ponder_enabled:
+			player.ponder(self.predict_states())
+
+	def predict_states(self):
+		"""
+		Return the states the other player could start their turn in, if the 
+		active player discards now. Any plays to the center must be followed by a
+		discard, so after each play the list is complete again. Each discard is
+		made and undone on one GameState of the game.
+		"""
+		model = self.model
+		state = model.build_view_for_player()
+		# a discard doesn't change the stock, so the other player always fills
+		# their hand with the same cards
+		hand = copy(model.get_player(True)[HAND])
+		hand.add_cards(copy(model.stock).draw(num=model.HAND_SIZE - len(hand)))
+		hand = Card.encode_pile(hand)
+
+		states = []
+		seen = set()
+		for card in state.get_player()[HAND]:
+			if card in seen:
+				continue
+			seen.add(card)
+			for pile_id in range(model.NUM_STACKS):
+				try:
+					state.place_card(PlayerMove(card, from_pile=HAND, to_pile=DISCARD, to_id=pile_id))
+				except InvalidMove:
+					continue
+				predicted = state.view_for_other_player(hand)
+				state.undo_move()
+				if predicted not in states:
+					states.append(predicted)
+		return states
+
+	def _draw_view(self, active_player, other_player, prev_active):
+		" Draw the board for the human player(s) "
+		# special case for both human players, blank the screen if it's a new players turn
+		if type(self.players[active_player]) == type(self.players[other_player]) \
+				== HumanPlayer and prev_active != active_player:
+			self.view.wait_screen()
+
+		if type(self.players[active_player]) == HumanPlayer:
+			self.view.draw_board(active_player)
+		elif type(self.players[other_player]) == HumanPlayer:
+			self.view.draw_board(other_player)
+
+	def _show_error(self, message):
+		" Report an invalid move "
+		if self.view:
+			self.view.show_error(message)
+		else:
+			log.warn(message)
 
 
 if __name__ == "__main__":
 	logging.config.fileConfig('./conf/logging.conf')
-	game = SpiteAndMalice()
-	game.run()
-
+	if sys.argv[1:2] == ['simulate']:
+		import simulate
+		simulate.main(sys.argv[2:])
+	elif sys.argv[1:2] == ['replay']:
+		import record
+		record.main(sys.argv[2:])
+	else:
+		# snm --record file, to write the record of the game to file
+		record_file = None
+		if sys.argv[1:2] == ['--record']:
+			record_file = sys.argv[2]
+		game = SpiteAndMalice(record=record_file)
+		try:
+			game.run()
+		finally:
+			for player in game.players:
+				if hasattr(player, 'close'):
+					player.close()
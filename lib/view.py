@@ -4,9 +4,10 @@
 
 import pygame
 from pygame.locals import *
-from cardView import CardGroup
+from cardView import CardGroup, CardImages
 from model import *
 from player import HumanPlayer
+import time
 import logging
 
 log = logging.getLogger('snm.view')
@@ -14,30 +15,73 @@ log = logging.getLogger('snm.view')
 # TODO: highlight selected card
 
 
+class InputQueue(object):
+	"""
+	The input events from pygame. Only the events the game handles are queued,
+	and get blocks until there is one, so waiting for input uses no CPU.
+	"""
+
+	EVENTS = [QUIT, KEYDOWN, KEYUP, MOUSEBUTTONUP]
+
+	def __init__(self):
+		pygame.event.set_blocked(None)
+		pygame.event.set_allowed(self.EVENTS)
+
+	def get(self):
+		" Block until there is an input event, and return it "
+		return pygame.event.wait()
+
+	@staticmethod
+	def is_quit(event):
+		" Return True if the event is a request to quit "
+		return event.type == QUIT or event.type == KEYDOWN and event.key == K_ESCAPE
+
+
 class GameView(object):
 	" The local visual display of the game for human players "
 
 	screen = None
 	window_size = (650,600)
 	STD_FONT = './media/FreeSans.ttf'
+	BG_COLOR = (80, 120, 80)
 
-	def __init__(self, model, players):
+	def __init__(self, model, players, move_delay=0.3):
+		"""
+		move_delay is the least number of seconds computer moves are shown for,
+		so a human can follow them.
+		"""
 		# store model and players
 		self.model = model
 		self.players = players 
+		self.move_delay = move_delay
+		self.last_refresh = 0
 
 		# setup pygame 
 		if not self.screen:
 			pygame.init()
 			self.screen = pygame.display.set_mode(self.window_size)
 			pygame.display.set_caption('Spite and Malice!')
+		self.input_queue = InputQueue()
+		# load the card images before the first draw
+		if not CardImages.atlas:
+			CardImages.load()
 		self.background = pygame.Surface(self.screen.get_size()).convert()
+		# fonts by size, so they are only loaded once
+		self.fonts = {}
+		# what was last drawn for each part of the board, and for which player
+		self.drawn = {}
+		self.drawn_player = None
+		# time taken by the last draw_board, and all of them
+		self.frame_time = 0
+		self.frame_time_total = 0
+		self.frame_count = 0
 
 
 	def wait_screen(self):
 		" blank the screen and wait for the next player to be ready "
+		self.drawn_player = None
 		self.background.fill((0, 0, 0))
-		font = pygame.font.Font(self.STD_FONT, 40)
+		font = self._font(40)
 		text = "Player %d" % (self.model.active_player + 1)
 		surf = font.render(text, True, (255, 80, 80))
 		bg_rect = self.background.get_rect()
@@ -45,19 +89,19 @@ class GameView(object):
 				centerx=bg_rect.centerx))
 		self._refresh_view()
 		while True:
-			for event in pygame.event.get():
-				if event.type == MOUSEBUTTONUP or event.type == KEYUP:
-					return
+			event = self.input_queue.get()
+			if event.type == MOUSEBUTTONUP or event.type == KEYUP:
+				return
 
 	def game_over(self):
 		" Inform the players the game is over "
 		log.warn("Game Over! Player %d won" % (self.model.active_player+1))
+		log.info("Drew the board %d times, %.3fms on average" % (self.frame_count,
+				self.mean_frame_time() * 1000))
 		print "Game Over! Player %d won" % (self.model.active_player+1)
 		while True:
-			for event in pygame.event.get():
-				# quit
-				if event.type == QUIT or event.type == KEYDOWN and event.key == K_ESCAPE:
-					return None
+			if self.input_queue.is_quit(self.input_queue.get()):
+				return None
 
 
 	def show_error(self, message):
@@ -67,14 +111,61 @@ class GameView(object):
 
 
 	def draw_board(self, player_id):
-		" place the cards on the screen for the view of player_id "
+		"""
+		place the cards on the screen for the view of player_id. Only the parts
+		of the board that changed since the last draw are drawn and updated on
+		the screen.
+		"""
+		start = time.time()
 		# group for cards for selection
 		self.select_group = CardGroup()
 		self.target_group = CardGroup()
-		other_group = CardGroup()
+		self.other_group = CardGroup()
+
+		# start again if the board was drawn for the other player
+		full = player_id != self.drawn_player
+		if full:
+			self.drawn = {}
+			self.drawn_player = player_id
+			self.background.fill(self.BG_COLOR)
+
+		dirty = []
+		for key, contents, area, draw in self._layout(player_id):
+			surface = None
+			if key not in self.drawn or self.drawn[key] != contents:
+				self.drawn[key] = contents
+				surface = self.background
+				surface.fill(self.BG_COLOR, area)
+				dirty.append(area)
+			draw(surface)
+
+		if full:
+			self._refresh_view()
+		else:
+			self._refresh_view(dirty)
+		self.frame_time = time.time() - start
+		self.frame_count += 1
+		self.frame_time_total += self.frame_time
+		log.debug("Drew %d parts of the board in %.3fms", len(dirty), self.frame_time * 1000)
+
+
+	def mean_frame_time(self):
+		" Return the average time in seconds draw_board has taken "
+		return self.frame_time_total / max(self.frame_count, 1)
+
+
+	def _layout(self, player_id):
+		"""
+		Return a list of the parts of the board for player_id. Each is a tuple of 
+		a key, a copy of the cards shown, the area of the background it is drawn
+		in, and a function that places its cards, and draws them on the surface 
+		it is passed if it is not None.
+		"""
 		background = self.background
+		player = self.model.players[player_id]
 		# other player
 		other_id = int(not player_id)
+		opponent = self.model.players[other_id]
 
 		# defines for placement
 		card_width = 75
@@ -83,83 +174,128 @@ class GameView(object):
 		card_layer_y = 20
 		discard_left_x = 40 + card_width * 4
 		center = background.get_rect().centery
+		bottom = background.get_rect().bottom
+		blank = CardImages.blankImage
+		parts = []
 
-		# clear the background
-		background.fill((80, 120, 80))
 		# place center stacks
-		for i in range(len(self.model.center_stacks)):
+		def draw_center(i, surface):
 			pile = self.model.center_stacks[i]
 			if len(pile) < 1:
 				card = self.target_group.makeBlank((CENTER, i))
 			else:
 				card = self.target_group.makeCard(pile[-1], (CENTER, i))
-			card.place(background, card.get_rect(centery=center, x=10 + card_width * i))
+			card.place(surface, card.get_rect(centery=center, x=10 + card_width * i))
 			# put a number on kings
-			if card.model and card.model[0] == 'K':
-				font = pygame.font.Font(self.STD_FONT, 20)
+			if surface and card.model and card.model[0] == 'K':
+				font = self._font(20)
 				text = str(Card.values[len(pile)-1])
 				surf = font.render(text, True, (50, 50, 120), (0xFF, 0xFF, 0xFF))
-				background.blit(surf, surf.get_rect(left=card.loc.left+2, top=card.loc.top+2))
-				
+				surface.blit(surf, surf.get_rect(left=card.loc.left+2, top=card.loc.top+2))
+		for i in range(len(self.model.center_stacks)):
+			pile = self.model.center_stacks[i]
+			parts.append(((CENTER, i), (len(pile), len(pile) and pile[-1]), 
+					blank.get_rect(centery=center, x=10 + card_width * i),
+					lambda surface, i=i: draw_center(i, surface)))
+
 		# place hand
-		player = self.model.players[player_id]
-		for i in range(len(player[HAND])):
-			card = self.select_group.makeCard(player[HAND][i], (HAND,None))
-			card.place(background, card.get_rect(x=10 + card_layer_x * i, 
-					y=background.get_rect().bottom - card_height))
+		def draw_hand(surface):
+			for i in range(len(player[HAND])):
+				card = self.select_group.makeCard(player[HAND][i], (HAND,None))
+				card.place(surface, card.get_rect(x=10 + card_layer_x * i, y=bottom - card_height))
+		parts.append((HAND, tuple(player[HAND]), 
+				pygame.Rect(0, bottom - card_height, discard_left_x, card_height), draw_hand))
 
 		# place pay-off
-		card = self.select_group.makeCard(player[PAY_OFF][-1], (PAY_OFF,None))
-		card.place(background, card.get_rect(x=10, 
-				centery=int(background.get_rect().height * 0.73)))
-		card = other_group.makeCard(self.model.players[other_id][PAY_OFF][-1],
-				None)
-		card.place(background, card.get_rect(x=10, 
-				centery=int(background.get_rect().height * 0.28)))
+		po_rect = blank.get_rect(x=10, centery=int(background.get_rect().height * 0.73))
+		def draw_pay_off(surface):
+			card = self.select_group.makeCard(player[PAY_OFF][-1], (PAY_OFF,None))
+			card.place(surface, po_rect)
+		parts.append((PAY_OFF, player[PAY_OFF][-1], po_rect, draw_pay_off))
+
+		other_po_rect = blank.get_rect(x=10, centery=int(background.get_rect().height * 0.28))
+		def draw_other_pay_off(surface):
+			card = self.other_group.makeCard(opponent[PAY_OFF][-1], None)
+			card.place(surface, other_po_rect)
+		parts.append(((PAY_OFF, other_id), opponent[PAY_OFF][-1], other_po_rect, draw_other_pay_off))
 
 		# place player discard piles
-		for pile_num in range(self.model.NUM_STACKS):
+		def draw_discard(pile_num, surface):
 			for n in range(len(player[DISCARD][pile_num])):
-				card = other_group.makeCard(player[DISCARD][pile_num][n], None)
-				card.place(background, card.get_rect(
+				card = self.other_group.makeCard(player[DISCARD][pile_num][n], None)
+				card.place(surface, card.get_rect(
 						top=20 + center + n * card_layer_y, x=discard_left_x + pile_num * card_width))
 				if n == len(player[DISCARD][pile_num])-1:
 					self.target_group.addCard(card, (DISCARD, pile_num))
 					self.select_group.addCard(card, (DISCARD, pile_num))
 			if not len(player[DISCARD][pile_num]):
 				card = self.target_group.makeBlank((DISCARD, pile_num))
-				card.place(background, card.get_rect(
+				card.place(surface, card.get_rect(
 						top=20 + center, x=discard_left_x + pile_num * card_width))
+		for pile_num in range(self.model.NUM_STACKS):
+			parts.append(((DISCARD, pile_num), tuple(player[DISCARD][pile_num]),
+					pygame.Rect(discard_left_x + pile_num * card_width, 20 + center,
+					card_width, bottom - 20 - center),
+					lambda surface, pile_num=pile_num: draw_discard(pile_num, surface)))
 
 		# place opponents discard piles
-		opponent = self.model.players[other_id]
-		for pile_num in range(self.model.NUM_STACKS):
+		def draw_other_discard(pile_num, surface):
 			for n in range(len(opponent[DISCARD][pile_num])):
-				card = other_group.makeCard(opponent[DISCARD][pile_num][n], None)
-				card.place(background, card.get_rect(
+				card = self.other_group.makeCard(opponent[DISCARD][pile_num][n], None)
+				card.place(surface, card.get_rect(
 						bottom= center - 20 - n * card_layer_y, x=discard_left_x + pile_num * card_width))
 			if not len(opponent[DISCARD][pile_num]):
-				card = other_group.makeBlank(None)
-				card.place(background, card.get_rect(
+				card = self.other_group.makeBlank(None)
+				card.place(surface, card.get_rect(
 						bottom= -20 + center, x=discard_left_x + pile_num * card_width))
+		for pile_num in range(self.model.NUM_STACKS):
+			parts.append(((DISCARD, other_id, pile_num), tuple(opponent[DISCARD][pile_num]),
+					pygame.Rect(discard_left_x + pile_num * card_width, 0, card_width, center - 20),
+					lambda surface, pile_num=pile_num: draw_other_discard(pile_num, surface)))
 
 		# fliped over opponnts hand
-		for i in range(len(opponent[HAND])):
-			card = other_group.makeBack(None)
-			card.place(background, card.get_rect(x=10 + card_layer_x * i,
-					top=background.get_rect().top + 2))
+		def draw_other_hand(surface):
+			for i in range(len(opponent[HAND])):
+				card = self.other_group.makeBack(None)
+				card.place(surface, card.get_rect(x=10 + card_layer_x * i,
+						top=background.get_rect().top + 2))
+		parts.append(((HAND, other_id), len(opponent[HAND]),
+				pygame.Rect(0, 0, discard_left_x, card_height + 2), draw_other_hand))
 
 		# player text
-		font = pygame.font.Font(self.STD_FONT, 25)
+		font = self._font(25)
 		text = "Player %d" % (player_id + 1)
-		surf = font.render(text, True, (30, 30, 80))
-		background.blit(surf, surf.get_rect(left=10, top=center + card_height / 2 + 10))
+		text_rect = pygame.Rect((10, center + card_height / 2 + 10), font.size(text))
+		def draw_text(surface):
+			if surface:
+				surf = font.render(text, True, (30, 30, 80))
+				surface.blit(surf, text_rect)
+		parts.append(('text', text, text_rect, draw_text))
+		return parts
 
-		self._refresh_view()
+
+	def pace(self):
+		" Wait until the last move has been shown for move_delay seconds "
+		remaining = self.move_delay - (time.time() - self.last_refresh)
+		if remaining > 0:
+			time.sleep(remaining)
+
+
+	def _font(self, size):
+		" Return the standard font in size "
+		if size not in self.fonts:
+			self.fonts[size] = pygame.font.Font(self.STD_FONT, size)
+		return self.fonts[size]
 
 
-	def _refresh_view(self):
-		" refresh the view "
-		self.screen.blit(self.background, (0,0))
-		pygame.display.flip()
+	def _refresh_view(self, rects=None):
+		" refresh the view, or only the rects of it "
+		if rects is None:
+			self.screen.blit(self.background, (0,0))
+			pygame.display.flip()
+		else:
+			for rect in rects:
+				self.screen.blit(self.background, rect, rect)
+			pygame.display.update(rects)
+		self.last_refresh = time.time()
 
@@ -0,0 +1,5 @@
+"""
+ The agent, model and card models of the first version of the game, before
+ the search was made faster. They are kept unchanged, so bench_agent.py can
+ check the current search still chooses the same moves.
+"""
@@ -0,0 +1,100 @@
+"""
+  Benchmark the ComputerPlayer search. Compares it with the search of the
+  first version of the agent, kept unchanged in baseline/, which deep copied
+  the state for each node, and with the search split across processes. The
+  saved positions and num_positions random ones are searched, and it fails if
+  any of them chooses different moves than the baseline.
+
+  usage: bench_agent.py [num_positions] [processes]
+"""
+
+from benchutil import *
+from copy import deepcopy
+import multiprocessing
+import logging
+from baseline import agent as baseline_agent, model as baseline_model
+from baseline.cardmodels import Pile as BaselinePile
+
+
+class CountingPlayer(ComputerPlayer):
+	" ComputerPlayer that counts the nodes it evaluates "
+	nodes = 0
+
+	def _evaluate(self, node):
+		self.nodes += 1
+		return ComputerPlayer._evaluate(self, node)
+
+	def _evaluate_discard(self, node, reply_gain):
+		self.nodes += 1
+		return ComputerPlayer._evaluate_discard(self, node, reply_gain)
+
+
+class BaselinePlayer(baseline_agent.ComputerPlayer):
+	" The first version of the ComputerPlayer, counting the nodes it evaluates "
+	nodes = 0
+
+	def _evaluate(self, node):
+		self.nodes += 1
+		return baseline_agent.ComputerPlayer._evaluate(self, node)
+
+	def play_card(self, state):
+		" Search a state of the current model, as a state of the baseline model "
+		return baseline_agent.ComputerPlayer.play_card(self, baseline_state(state))
+
+	def close(self):
+		pass
+
+
+def baseline_state(state):
+	" Return a GameState of the baseline model with the cards of state "
+	def pile(cards):
+		pile = BaselinePile(cards)
+		pile.flip(all=True)
+		return pile
+	data = state.to_dict()
+	baseline = baseline_model.GameState.__new__(baseline_model.GameState)
+	baseline.active_player = data['active_player']
+	baseline.players = [{
+		HAND: pile(player[HAND]),
+		PAY_OFF: pile(player[PAY_OFF]),
+		DISCARD: map(pile, player[DISCARD]),
+	} for player in data['players']]
+	baseline.center_stacks = map(pile, data['center_stacks'])
+	return baseline
+
+
+def run(player_class, positions, **kwargs):
+	" Search each position, return the player, time and chosen moves "
+	player = player_class(**kwargs)
+	moves = []
+	with Timer() as timer:
+		for state in positions:
+			player.play_queue = []
+			first = player.play_card(deepcopy(state))
+			moves.append(map(unicode, [first] + player.play_queue))
+	player.close()
+	return player, timer.elapsed, moves
+
+
+if __name__ == "__main__":
+	positions = load_positions(os.path.join(os.path.dirname(__file__), 'positions.json'))
+	positions += random_positions(int((sys.argv[1:] or [20])[0]))
+	processes = int((sys.argv[2:] or [multiprocessing.cpu_count()])[0])
+	logging.getLogger('snm.agent').setLevel(logging.WARN)
+
+	results = {}
+	for name, player_class in (('current', CountingPlayer), ('baseline', BaselinePlayer)):
+		player, elapsed, moves = run(player_class, positions)
+		results[name] = moves
+		print "%-10s %8d nodes %8.2fs %10.0f nodes/s" % (name, player.nodes, elapsed,
+				player.nodes / elapsed)
+	different = [i for i in range(len(positions))
+			if results['current'][i] != results['baseline'][i]]
+	print "%d of %d positions chose different moves than the baseline %s" % (len(different),
+			len(positions), different or '')
+
+	serial, serial_elapsed, serial_moves = run(ComputerPlayer, positions)
+	parallel, elapsed, moves = run(ComputerPlayer, positions, processes=processes)
+	print "%d processes: %.2fs, serial: %.2fs, speedup %.2fx, same moves: %s" % (processes,
+			elapsed, serial_elapsed, serial_elapsed / elapsed, moves == serial_moves)
+	sys.exit((different or moves != serial_moves) and 1 or 0)
@@ -0,0 +1,50 @@
+"""
+  Benchmark the cost of the agents logging on the search. Plays the turns of
+  some positions with the agent logger at INFO, as conf/logging.conf sets it,
+  with the per node tracing of agent.TRACE off, with it on but not logged, and
+  with it logged at DEBUG to a stream that discards it. Before the tracing
+  was behind TRACE, every node was formatted, and terminals were logged at 
+  INFO, so the last row is close to the old cost.
+
+  usage: bench_logging.py [num_positions]
+"""
+
+from benchutil import *
+from copy import deepcopy
+import logging
+import agent
+
+
+class NullStream(object):
+	" A stream that discards what is written to it "
+	def write(self, text):
+		pass
+	def flush(self):
+		pass
+
+
+def turn_time(positions, trace, level):
+	" Return the mean time to search the turn of each position "
+	agent.TRACE = trace
+	agent.log.setLevel(level)
+	player = ComputerPlayer()
+	with Timer() as timer:
+		for state in positions:
+			player.play_queue = []
+			player.play_card(deepcopy(state))
+	player.close()
+	return timer.elapsed / len(positions)
+
+
+if __name__ == "__main__":
+	positions = random_positions(int((sys.argv[1:] or [20])[0]))
+	agent.log.addHandler(logging.StreamHandler(NullStream()))
+	agent.log.propagate = False
+
+	rows = [
+		("TRACE off, INFO", False, logging.INFO),
+		("TRACE on, INFO", True, logging.INFO),
+		("TRACE on, DEBUG", True, logging.DEBUG),
+	]
+	for name, trace, level in rows:
+		print "%-16s %8.2fms per turn" % (name, turn_time(positions, trace, level) * 1000)
@@ -0,0 +1,43 @@
+"""
+  Search some positions with the search metrics of ComputerPlayer, print them
+  as json for each position, and compare the time of the searches with and
+  without them. With a file name the searches are also profiled with cProfile,
+  and the stats are written to it.
+
+  usage: bench_metrics.py [num_positions] [profile_file]
+"""
+
+from benchutil import *
+from copy import deepcopy
+
+
+def search(positions, **kwargs):
+	" Search each position, return the player, the metrics of each search and the time "
+	player = ComputerPlayer(**kwargs)
+	metrics = []
+	with Timer() as timer:
+		for state in positions:
+			player.play_queue = []
+			player.play_card(deepcopy(state))
+			metrics.append(player.last_metrics)
+	player.close()
+	return player, metrics, timer.elapsed
+
+
+if __name__ == "__main__":
+	positions = random_positions(int((sys.argv[1:] or [20])[0]))
+	profile = (sys.argv[2:] or [None])[0]
+
+	player, metrics, elapsed = search(positions, metrics=True)
+	for i in range(len(positions)):
+		print i, json.dumps(metrics[i], sort_keys=True)
+	print
+	plain, plain_metrics, plain_elapsed = search(positions)
+	print "without metrics %6.2fs" % plain_elapsed
+	print "with metrics    %6.2fs" % elapsed
+	print "same nodes: %s" % ([m['nodes'] for m in metrics] == [m['nodes'] for m in plain_metrics])
+	if profile:
+		profiled, profiled_metrics, profiled_elapsed = search(positions, profile=profile)
+		print "with cProfile   %6.2fs" % profiled_elapsed
+		import pstats
+		pstats.Stats(profile).sort_stats('cumulative').print_stats(15)
@@ -0,0 +1,58 @@
+"""
+  Measure how much the canonical move generation of ComputerPlayer reduces the
+  branching of the search. Searches the saved positions with the moves of 
+  cards of the same rank in the hand deduped, and also with independent
+  center plays only searched in one order, and compares the nodes, the mean
+  number of successors of the expanded nodes, the time, and the moves chosen
+  with the search that generates every move.
+
+  usage: bench_successors.py [positions file]
+"""
+
+from benchutil import *
+from copy import deepcopy
+
+VARIANTS = [
+	('all moves', {'dedupe': False}),
+	('dedupe', {}),
+	('dedupe, permutations', {'skip_permutations': True}),
+]
+
+
+def search(positions, **kwargs):
+	" Search each position, return the moves chosen, the nodes, the branching and the time "
+	player = ComputerPlayer(metrics=True, **kwargs)
+	moves = []
+	nodes = 0
+	branching = {}
+	with Timer() as timer:
+		for state in positions:
+			player.play_queue = []
+			first = player.play_card(deepcopy(state))
+			moves.append(map(unicode, [first] + player.play_queue))
+			nodes += player.node_count
+			for count, num in player.last_metrics['branching'].items():
+				branching[count] = branching.get(count, 0) + num
+	player.close()
+	return moves, nodes, branching, timer.elapsed
+
+
+def mean_branching(branching):
+	" Mean number of successors of the nodes that had some "
+	expanded = sum(num for count, num in branching.items() if count)
+	return float(sum(count * num for count, num in branching.items())) / max(expanded, 1)
+
+
+if __name__ == "__main__":
+	filename = (sys.argv[1:] or [os.path.join(os.path.dirname(__file__), 'positions.json')])[0]
+	positions = load_positions(filename)
+
+	print "%d positions" % len(positions)
+	print "%-22s %8s %10s %8s %10s" % ('', 'nodes', 'branching', 'time', 'different')
+	base_moves = None
+	for name, kwargs in VARIANTS:
+		moves, nodes, branching, elapsed = search(positions, **kwargs)
+		base_moves = base_moves or moves
+		different = len([i for i in range(len(moves)) if moves[i] != base_moves[i]])
+		print "%-22s %8d %10.2f %7.2fs %10d" % (name, nodes, mean_branching(branching),
+				elapsed, different)
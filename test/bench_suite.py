@@ -0,0 +1,271 @@
+"""
+  Benchmark suite for the hot paths of the model, the search and the view.
+  Each benchmark is timed with timeit, and the results are written as json,
+  so the results of two commits can be compared:
+
+    bench_suite.py -o before.json
+    (change something)
+    bench_suite.py -o after.json --compare before.json
+
+  The search is timed on the positions in bench_positions.json, from easy to
+  pathological, by the number of nodes searched. The view benchmarks need
+  pygame, and use the dummy SDL video driver. They are skipped without it.
+
+  usage: bench_suite.py [options]
+"""
+
+from benchutil import *
+from bench_utility import RecordingPlayer
+from cardmodels import Pile, Deck, Card
+from optparse import OptionParser
+import logging
+import platform
+import subprocess
+import timeit
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_positions.json')
+CORPUS = ['easy', 'medium', 'hard', 'pathological']
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# name: function that sets up a benchmark, and returns the function to time
+BENCHMARKS = []
+
+
+def benchmark(name):
+	" Register a benchmark setup function under name "
+	def register(setup):
+		BENCHMARKS.append((name, setup))
+		return setup
+	return register
+
+
+def new_model(seed=1):
+	" Return a newly dealt model, with the first player to play "
+	model = SpiteAndMaliceModel(random.Random(seed))
+	model.active_player = 0
+	return model
+
+
+def discard_move(model):
+	" Return a move that discards the first card of the hand that isn't a king "
+	for card in model.get_player()[HAND]:
+		if model.card_rank(card) != 13:
+			return PlayerMove(card, from_pile=HAND, to_pile=DISCARD, to_id=0)
+
+
+@benchmark('pile.draw_add_top')
+def pile_draw_add_top():
+	pile = Pile(Deck(num_packs=2, rng=random.Random(1)))
+	return lambda: pile.add_cards(pile.draw(num=5), cards_to=Pile.TOP)
+
+
+@benchmark('pile.draw_add_bottom')
+def pile_draw_add_bottom():
+	pile = Pile(Deck(num_packs=2, rng=random.Random(1)))
+	return lambda: pile.add_cards(pile.draw(num=12, cards_from=Pile.BOTTOM),
+			cards_to=Pile.BOTTOM)
+
+
+@benchmark('pile.draw_random')
+def pile_draw_random():
+	pile = Pile(Deck(num_packs=2, rng=random.Random(1)), rng=random.Random(1))
+	return lambda: pile.add_cards(pile.draw(cards_from=Pile.RANDOM), cards_to=Pile.TOP)
+
+
+@benchmark('pile.shuffle')
+def pile_shuffle():
+	pile = Pile(Deck(rng=random.Random(1))[:12], rng=random.Random(1))
+	return pile.shuffle
+
+
+@benchmark('pile.packed')
+def pile_packed():
+	pile = Pile(Deck(rng=random.Random(1))[:20])
+	def run():
+		pile.append(pile.pop())
+		pile.packed()
+	return run
+
+
+@benchmark('model.place_card')
+def model_place_card():
+	" place a discard and undo it "
+	model = new_model()
+	player_move = discard_move(model)
+	def run():
+		model.place_card(player_move)
+		model.undo_move()
+	return run
+
+
+@benchmark('state.place_card')
+def state_place_card():
+	" place a discard and undo it, on the packed state "
+	model = new_model()
+	state = model.build_view_for_player()
+	player_move = discard_move(model)
+	player_move.card = Card.encode(player_move.card)
+	def run():
+		state.place_card(player_move)
+		state.undo_move()
+	return run
+
+
+@benchmark('state.build')
+def state_build():
+	model = new_model()
+	return model.build_view_for_player
+
+
+@benchmark('state.snapshot')
+def state_snapshot():
+	return new_model().build_view_for_player().snapshot
+
+
+@benchmark('agent.utility')
+def agent_utility():
+	" score the nodes searched for the medium position "
+	recorder = RecordingPlayer()
+	recorder.play_card(load_positions(CORPUS_FILE)[1])
+	nodes = recorder.nodes
+	player = ComputerPlayer()
+	return lambda: map(player._utility, nodes)
+
+
+def search_benchmark(index):
+	" Register a benchmark of play_card on a position of the corpus "
+	def setup():
+		state = load_positions(CORPUS_FILE)[index]
+		return lambda: ComputerPlayer().play_card(state.snapshot())
+	benchmark('agent.play_card.%s' % CORPUS[index])(setup)
+
+for _index in range(len(CORPUS)):
+	search_benchmark(_index)
+
+
+def new_view():
+	" Return a view of a new model, on the dummy video driver "
+	os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+	from view import GameView
+	from player import HumanPlayer
+	# the view loads its fonts and images from the top of the repository
+	os.chdir(ROOT)
+	model = new_model()
+	return GameView(model, [HumanPlayer(), ComputerPlayer()]), model
+
+
+@benchmark('view.draw_board_full')
+def view_draw_board_full():
+	view, model = new_view()
+	def run():
+		view.drawn_player = None
+		view.draw_board(0)
+	return run
+
+
+@benchmark('view.draw_board_move')
+def view_draw_board_move():
+	" draw the board after a discard, and after it is undone "
+	view, model = new_view()
+	player_move = discard_move(model)
+	view.draw_board(0)
+	def run():
+		model.place_card(player_move)
+		view.draw_board(0)
+		model.undo_move()
+		view.draw_board(0)
+	return run
+
+
+def measure(func, repeat, min_time=0.05):
+	"""
+	Time func, calling it enough times for each of repeat runs to take at
+	least min_time seconds. Returns a dict of the times per call.
+	"""
+	timer = timeit.Timer(func)
+	number = 1
+	while timer.timeit(number) < min_time:
+		number *= 2
+	times = [elapsed / number for elapsed in timer.repeat(repeat, number)]
+	mean = sum(times) / len(times)
+	return {
+		'min': min(times),
+		'mean': mean,
+		'stddev': (sum((t - mean) ** 2 for t in times) / len(times)) ** 0.5,
+		'number': number,
+		'repeat': repeat,
+	}
+
+
+def run(names, repeat):
+	" Run the benchmarks whose names start with one of names, return the results "
+	results = {}
+	for name, setup in BENCHMARKS:
+		if names and not [prefix for prefix in names if name.startswith(prefix)]:
+			continue
+		try:
+			func = setup()
+		except ImportError, error:
+			results[name] = {'skipped': str(error)}
+		else:
+			results[name] = measure(func, repeat)
+		print_result(name, results[name])
+	return results
+
+
+def print_result(name, result, before=None):
+	" Print the time of a benchmark, and the change from before if there is one "
+	if 'skipped' in result:
+		print "%-32s skipped: %s" % (name, result['skipped'])
+		return
+	line = "%-32s %10.2fus +- %.2f" % (name, result['min'] * 1e6, result['stddev'] * 1e6)
+	if before and 'min' in before:
+		line += "   %10.2fus  %6.2fx" % (before['min'] * 1e6, result['min'] / before['min'])
+	print line
+
+
+def git_commit():
+	" Return the commit of the repository, or None "
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def main(args):
+	parser = OptionParser(usage="bench_suite.py [options] [benchmark prefixes]")
+	parser.add_option('-r', '--repeat', type='int', default=5, help="runs of each benchmark")
+	parser.add_option('-o', '--output', help="file to write the results to, as json")
+	parser.add_option('-c', '--compare', help="results file to compare the times with")
+	parser.add_option('-l', '--list', action='store_true', help="list the benchmarks")
+	options, names = parser.parse_args(args)
+
+	if options.list:
+		for name, setup in BENCHMARKS:
+			print name
+		return
+	# the search logs every turn at INFO
+	logging.getLogger('snm.agent').setLevel(logging.WARN)
+	results = run(names, options.repeat)
+	report = {
+		'commit': git_commit(),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'results': results,
+	}
+	if options.output:
+		with open(options.output, 'w') as out:
+			json.dump(report, out, indent=1, sort_keys=True)
+			out.write('\n')
+	if options.compare:
+		with open(options.compare) as data:
+			before = json.load(data)
+		print
+		print "compared with %s" % (before.get('commit') or options.compare)
+		for name in sorted(results):
+			print_result(name, results[name], before['results'].get(name))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
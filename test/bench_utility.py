@@ -0,0 +1,238 @@
+"""
+  Benchmark of ComputerPlayer._utility. Records the nodes the search scores
+  for some positions, then scores them with the current utility function and
+  with the one it replaced, which rebuilt the points and center orders for 
+  every node. Checks both give the same values. Then searches the positions
+  with the successors of each node scored together by batch.BatchUtility, and
+  checks its values are the same as _utility.
+
+  usage: bench_utility.py [num_positions] [repeat]
+"""
+
+from benchutil import *
+from copy import deepcopy
+from agent import StateNode
+from cardmodels import RANK_SHIFT
+
+ALL = 'all'
+
+
+class RecordingPlayer(ComputerPlayer):
+	" Keeps a copy of each node it scores "
+
+	def __init__(self, **kwargs):
+		ComputerPlayer.__init__(self, **kwargs)
+		self.nodes = []
+
+	def _utility(self, node):
+		self.nodes.append(StateNode(node.state.snapshot(), node.action,
+				node.parent_node, node.player, node.swap_player))
+		return ComputerPlayer._utility(self, node)
+
+
+class BatchCheckPlayer(ComputerPlayer):
+	" Compares the values of the batch scores with _utility "
+
+	def __init__(self, **kwargs):
+		ComputerPlayer.__init__(self, batch=True, **kwargs)
+		self.checked = 0
+		self.different = 0
+
+	def _make_move(self, node):
+		ComputerPlayer._make_move(node)
+		if node.util_value is not None:
+			self.checked += 1
+			self.different += node.util_value != self._utility(node)
+
+
+class ReferencePlayer(ComputerPlayer):
+	" The utility function before the points and value tables were precomputed "
+
+	@staticmethod
+	def _points():
+		" Points for each kind of move, used to calculate the utility value "
+		# FIXME: Balance points so that placing on center only when necesarry (discard full, or no closer to po for op)
+		return {
+			# to discard pile
+			DISCARD: (10, {
+				'on_same': 50,			# Discard on same value card
+				'on_empty': 30,			# Discard on empty pile
+				'common_in_hand': 10,	# Each time the discard card occures in the hard
+				'least_essential': 5,	# Discard least essential card
+				'bury_least': 2,		# Discard buries the least essential card
+			}),
+			# to center
+			CENTER: (0, {
+				'pay_off': 1000,		# Play the pay off card
+			}),
+			# from hand
+			HAND: (0, {
+				'empty_hand': 120,		# Empty hand without a discard
+			}),
+			# All moves
+			ALL: {
+				'op_dist_po': 30,		# Each point away the closest center is from opponents pay off (max *12)
+			},
+			# Opponent play
+			StateNode.OTHER: (0, {
+				'from_discard': -10,	# Opponent plays from discard
+				'from_pay_off': -1000,	# Opponent plays pay_off card
+			})
+		}
+
+
+	def _utility(self, node):
+		""" 
+		Calculate the utility value for this state node.
+		"""
+		points = self._points()
+
+		# shortcut vars
+		center_values = []
+		for pile in node.state.center_stacks:
+			center_values.append(len(pile))
+		if node.player == StateNode.SELF:
+			myself = node.state.get_player()
+			other = node.state.get_player(True)
+		else:
+			myself = node.state.get_player(True)
+			other = node.state.get_player()
+
+
+		value = 0
+		# each point away the closest center is from opponents pay off
+		if len(other[PAY_OFF]):
+			value += points[ALL]['op_dist_po'] * \
+					self._find_min_center_distance(center_values, other[PAY_OFF][-1] >> RANK_SHIFT)
+		if node.player == StateNode.SELF:
+
+			if node.action.to_pile == DISCARD:
+				card_value = node.action.card >> RANK_SHIFT
+				hand_values = [card >> RANK_SHIFT for card in myself[HAND]]
+				pay_off_value = myself[PAY_OFF][-1] >> RANK_SHIFT
+				value += points[DISCARD][0]
+				# discard on empty pile
+				if len(myself[DISCARD][node.action.to_id]) == 1:
+					value += points[DISCARD][1]['on_empty']
+				# discard on same value card
+				if len(myself[DISCARD][node.action.to_id]) > 1 \
+						and myself[DISCARD][node.action.to_id][-1] >> RANK_SHIFT == \
+						myself[DISCARD][node.action.to_id][-2] >> RANK_SHIFT:
+					value += points[DISCARD][1]['on_same']
+				# each time the discard cards value ocurs in the hand
+				value += points[DISCARD][1]['common_in_hand'] * hand_values.count(card_value)
+				# discard least essential card
+				if 0 == self._find_least_essential_card(
+						center_values, [card_value] + hand_values, pay_off_value):
+					value += points[DISCARD][1]['least_essential']
+				# discard buries least essential card
+				if len(myself[DISCARD][node.action.to_id]) >= 1:
+					discard_piles = self._build_pre_play_discard_piles(node)
+					if node.action.to_id == self._find_least_essential_card(center_values,
+							discard_piles, pay_off_value):
+						value += points[DISCARD][1]['bury_least']
+
+			elif node.action.to_pile == CENTER:
+				value += points[CENTER][0]
+				# pay off played
+				if node.action.from_pile == PAY_OFF:
+					value += points[CENTER][1]['pay_off']
+
+			if node.action.from_pile == HAND:
+				value += points[HAND][0]
+				# empty hand without a discard
+				if len(myself[HAND]) == 0 and node.action.to_pile != DISCARD:
+					value += points[HAND][1]['empty_hand']
+
+		# opponents plays
+		else:
+			value += points[StateNode.OTHER][0]
+			if node.action.from_pile == PAY_OFF:
+				value += points[StateNode.OTHER][1]['from_pay_off']
+			if node.action.from_pile == DISCARD:
+				value += points[StateNode.OTHER][1]['from_discard']
+
+		# cumulative utils
+		return value + node.parent_node.util_value
+
+
+	@staticmethod
+	def _find_least_essential_card(center_values, pile, pay_off_card):
+		"""
+		Return the index in pile that is considered least essential relative to the
+		pay off card. pile is a list of card values.
+		"""
+		min_score = ComputerPlayer.MAX_VALUE
+		min_card = None
+
+		# arrange the center piles by furthest to closest card
+		value_to_center_distance = {}
+		for i in range(len(center_values)):
+			dist = ComputerPlayer._distance_between_values(center_values[i], pay_off_card)
+			value_to_center_distance[center_values[i]] = dist
+		center_values.sort(cmp=lambda a, b: value_to_center_distance[b] - value_to_center_distance[a])
+
+		# find the lowest score for cards in the pile
+		for i in range(len(pile)):
+			score = 0
+			card = pile[i]
+			# calculate the score for each center pile
+			for center_id in range(len(center_values)):
+				if ComputerPlayer._is_card_between_values(card, center_values[center_id], pay_off_card):
+					score += 2**center_id
+
+			# store the minimum
+			if score < min_score:
+				min_score = score
+				min_card = card
+
+		return pile.index(min_card)
+
+
+	@staticmethod
+	def _find_min_center_distance(center_values,  pay_off_card):
+		"""
+		return the value from the center stack that is closest available
+		for playing the pay_off_card.
+		"""
+		return min(map(lambda v: ComputerPlayer._distance_between_values(v, pay_off_card), center_values))
+
+
+def score(player, nodes, repeat):
+	" Score all the nodes repeat times, return the values and the time taken "
+	with Timer() as timer:
+		for i in range(repeat):
+			values = map(player._utility, nodes)
+	return values, timer.elapsed
+
+
+if __name__ == "__main__":
+	positions = random_positions(int((sys.argv[1:] or [20])[0]))
+	repeat = int((sys.argv[2:] or [5])[0])
+
+	recorder = RecordingPlayer()
+	for state in positions:
+		recorder.play_card(deepcopy(state))
+	nodes = recorder.nodes
+	calls = len(nodes) * repeat
+
+	reference_values, reference_time = score(ReferencePlayer(), nodes, repeat)
+	values, elapsed = score(ComputerPlayer(), nodes, repeat)
+	print "%d nodes, scored %d times" % (len(nodes), repeat)
+	print "reference %8.2fus per node" % (reference_time / calls * 1e6)
+	print "tables    %8.2fus per node" % (elapsed / calls * 1e6)
+	print "speedup %.2fx, same values: %s" % (reference_time / elapsed, values == reference_values)
+
+	import batch
+	print
+	print "batch scoring with numpy %s" % (batch.numpy and batch.numpy.__version__)
+	checker = BatchCheckPlayer()
+	for state in positions:
+		checker.play_card(deepcopy(state))
+	print "%d nodes checked, %d different" % (checker.checked, checker.different)
+	for kwargs in ({}, {'batch': True}):
+		player = ComputerPlayer(**kwargs)
+		with Timer() as timer:
+			for state in positions:
+				player.play_card(deepcopy(state))
+		print "search %-16s %6.2fs" % (kwargs, timer.elapsed)
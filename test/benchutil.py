@@ -0,0 +1,82 @@
+"""
+ Helpers shared by the benchmark scripts.
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+import random
+import time
+import json
+from model import *
+from agent import ComputerPlayer
+
+
+def finish_move(model, player_move):
+	" Update the model after a move, the same way the controller does "
+	model.mix_into_stock()
+	if player_move.to_pile != DISCARD and len(model.get_player()[HAND]) == 0:
+		model.fill_hand()
+	if player_move.to_pile == DISCARD:
+		model.swap_players()
+		model.fill_hand()
+
+
+def random_move(model, rng):
+	" Make a random legal move on the model. "
+	state = model.build_view_for_player()
+	moves = []
+	for pile_name, pile_len in [(HAND,1), (PAY_OFF,1), (DISCARD,4)]:
+		for pile_id in range(pile_len):
+			moves.extend(map(ComputerPlayer._unpack_move,
+					ComputerPlayer._get_center_move_from(state, pile_name, pile_id)))
+	discards = [c for c in model.get_player()[HAND] if c[0] != 'K']
+	if discards and (not moves or rng.random() < 0.3):
+		moves = [PlayerMove(rng.choice(discards), from_pile=HAND,
+				to_pile=DISCARD, to_id=rng.randrange(model.NUM_STACKS))]
+	player_move = rng.choice(moves)
+	model.place_card(player_move)
+	finish_move(model, player_move)
+
+
+def random_positions(count, seed=0, max_moves=40):
+	"""
+	Return a list of count GameStates, each reached by making a random number of
+	random legal moves from a new deal.
+	"""
+	rng = random.Random(seed)
+	positions = []
+	while len(positions) < count:
+		model = SpiteAndMaliceModel(random.Random(rng.random()))
+		model.active_player = 0
+		for i in range(rng.randint(0, max_moves)):
+			random_move(model, rng)
+			if model.is_won():
+				break
+		if not model.is_won():
+			positions.append(model.build_view_for_player())
+	return positions
+
+
+def save_positions(positions, filename):
+	" Save a list of GameStates as json "
+	with open(filename, 'w') as out:
+		json.dump([state.to_dict() for state in positions], out, indent=1, sort_keys=True)
+		out.write('\n')
+
+
+def load_positions(filename):
+	" Load a list of GameStates saved by save_positions "
+	with open(filename) as data:
+		return [GameState.from_dict(state) for state in json.load(data)]
+
+
+class Timer(object):
+	" Context manager that records the elapsed wall clock time "
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *args):
+		self.elapsed = time.time() - self.start
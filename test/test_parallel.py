@@ -0,0 +1,44 @@
+"""
+  Regression test for the parallel search. Searches each of the saved
+  positions with one process and with a pool of two, for players that don't
+  use the default settings, and checks the same moves are chosen. The worker
+  processes have to search with the settings of the player that started them.
+
+  usage: test_parallel.py [positions file]
+"""
+
+from benchutil import *
+from agent import Weights
+import logging
+
+# settings of the players to compare, by name
+SETTINGS = [
+	('weights', {'weights': Weights(discard_on_same=5, discard_on_empty=60,
+			op_dist_po=10, other_from_discard=-40)}),
+	('dedupe', {'dedupe': False}),
+	('skip', {'skip_permutations': True}),
+]
+
+
+def moves(player, state):
+	" Return the moves chosen for state "
+	player.play_queue = []
+	return map(unicode, [player.play_card(state.snapshot())] + player.play_queue)
+
+
+if __name__ == "__main__":
+	filename = (sys.argv[1:] or [os.path.join(os.path.dirname(__file__), 'positions.json')])[0]
+	positions = load_positions(filename)
+	logging.getLogger('snm.agent').setLevel(logging.WARN)
+
+	failed = 0
+	for name, settings in SETTINGS:
+		serial = ComputerPlayer(**settings)
+		parallel = ComputerPlayer(processes=2, **settings)
+		different = [i for i, state in enumerate(positions)
+				if moves(serial, state) != moves(parallel, state)]
+		parallel.close()
+		failed += len(different)
+		print "%-10s %d of %d positions chose different moves %s" % (name, len(different),
+				len(positions), different or '')
+	sys.exit(failed and 1 or 0)
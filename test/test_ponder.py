@@ -0,0 +1,51 @@
+"""
+  Regression test for pondering. Ponders each of the saved positions, then
+  asks for the moves of the same position with its center stacks in the
+  reverse order, which has the same hash. The pondered moves must be moved to
+  the stacks of that state, and be the moves a search of it chooses.
+
+  usage: test_ponder.py [positions file]
+"""
+
+from benchutil import *
+from copy import deepcopy
+import logging
+
+
+def reverse_center(state):
+	" Return a copy of state with its center stacks in the reverse order "
+	data = state.to_dict()
+	data['center_stacks'].reverse()
+	return GameState.from_dict(data)
+
+
+def pondered(player, state, other):
+	" Ponder state, and return the moves the player plays for other "
+	player.play_queue = []
+	player.ponder([state])
+	while not player.ponderer.results:
+		time.sleep(0.01)
+	return map(unicode, [player.play_card(other)] + player.play_queue)
+
+
+def searched(state):
+	" Return the moves a search of state chooses "
+	player = ComputerPlayer()
+	return map(unicode, [player.play_card(deepcopy(state))] + player.play_queue)
+
+
+if __name__ == "__main__":
+	filename = (sys.argv[1:] or [os.path.join(os.path.dirname(__file__), 'positions.json')])[0]
+	positions = load_positions(filename)
+	logging.getLogger('snm.agent').setLevel(logging.WARN)
+
+	player = ComputerPlayer(ponder=True)
+	different = []
+	for i, state in enumerate(positions):
+		other = reverse_center(state)
+		if pondered(player, state, deepcopy(other)) != searched(other):
+			different.append(i)
+	player.close()
+	print "%d of %d pondered positions chose different moves %s" % (len(different),
+			len(positions), different or '')
+	sys.exit(different and 1 or 0)
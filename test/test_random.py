@@ -0,0 +1,53 @@
+"""
+  Regression test for the random.Random of a game. Copies of a pile, or of a
+  whole game, must shuffle and draw with their own copy of it, so they draw
+  the same cards as each other, and the same as the original.
+
+  usage: test_random.py
+"""
+
+from benchutil import *
+from cardmodels import Pile, Deck
+from copy import copy, deepcopy
+
+failed = 0
+
+def check(name, ok):
+	" Print the result of a check, and count it if it failed "
+	global failed
+	failed += not ok
+	print "%-40s %s" % (name, ok and 'ok' or 'FAILED')
+
+
+def draws(pile):
+	" Return the cards of a shuffle and some random draws from pile "
+	pile.shuffle()
+	return list(pile) + pile.draw(num=10, cards_from=Pile.RANDOM)
+
+
+def mixes(model):
+	" Return the stock after a center stack is mixed into it "
+	model.center_stacks[0].extend(model.stock.draw(num=12))
+	model.mix_into_stock()
+	return list(model.stock)
+
+
+if __name__ == "__main__":
+	pile = Pile(Deck(rng=random.Random(1)), rng=random.Random(2))
+	first, second = copy(pile), copy(pile)
+	check("copies keep an rng", first.rng is not None and second.rng is not None)
+	check("copies draw the same cards", draws(first) == draws(second) == draws(pile))
+
+	first, second = deepcopy(pile), deepcopy(pile)
+	check("deep copies draw the same cards", draws(first) == draws(second) == draws(pile))
+
+	model = SpiteAndMaliceModel(random.Random(3))
+	first, second = deepcopy(model), deepcopy(model)
+	check("a copied game shares one rng", first.stock.rng is first.rng and
+			first.center_stacks[0].rng is first.rng)
+	check("copied games mix the same stock", mixes(first) == mixes(second) == mixes(model))
+
+	check("games with the same seed deal the same",
+			list(SpiteAndMaliceModel(random.Random(4)).stock) ==
+			list(SpiteAndMaliceModel(random.Random(4)).stock))
+	sys.exit(failed and 1 or 0)
@@ -0,0 +1,68 @@
+"""
+  Regression test for game records. Records games between computer players,
+  and replays each of them with a different seed, past the center stacks
+  that were mixed into the stock, to the position the game ended in. The
+  same record without its mixes, as version 1 wrote it, must be refused.
+
+  usage: test_record.py [seed ...]
+"""
+
+from benchutil import *
+from snm import SpiteAndMalice
+from record import read_record, Replay
+import logging
+import tempfile
+
+SEEDS = [0, 1, 3]
+
+failed = 0
+
+def check(name, ok):
+	" Print the result of a check, and count it if it failed "
+	global failed
+	failed += not ok
+	print "%-50s %s" % (name, ok and 'ok' or 'FAILED')
+
+
+def cards(model):
+	" Return all the piles of model, as lists of cards "
+	piles = [model.stock] + model.center_stacks
+	for player in model.players:
+		piles += [player[PAY_OFF], player[HAND]] + player[DISCARD]
+	return [list(pile) for pile in piles]
+
+
+def play(seed, filename):
+	" Play and record a game, and return its model "
+	game = SpiteAndMalice([ComputerPlayer(), ComputerPlayer()], headless=True, seed=seed,
+			record=filename)
+	game.run(400)
+	return game.model
+
+
+if __name__ == "__main__":
+	logging.basicConfig()
+	logging.getLogger('snm.agent').setLevel(logging.ERROR)
+	seeds = map(int, sys.argv[1:]) or SEEDS
+
+	for seed in seeds:
+		filename = tempfile.mktemp(suffix='.jsonl')
+		model = play(seed, filename)
+		record = read_record(filename)
+		os.remove(filename)
+		check("seed %d: %d moves, %d mixes" % (seed, len(record.moves), len(record.mixes)),
+				len(record.mixes) > 0)
+
+		record.seed = seed + 1000
+		replay = Replay(record)
+		check("seed %d: replays with another seed" % seed, not replay.seed_matches and
+				cards(replay.position(len(replay))) == cards(model))
+
+		record.version, record.mixes = 1, {}
+		try:
+			Replay(record)
+			refused = False
+		except ValueError:
+			refused = True
+		check("seed %d: version 1 refuses another seed" % seed, refused)
+	sys.exit(failed and 1 or 0)
@@ -0,0 +1,41 @@
+"""
+  Regression test for the pruning of the ComputerPlayer search. Searches each
+  of the saved positions with and without pruning, checks the same moves are
+  chosen, and reports how many fewer nodes were searched. Both searches use
+  the transposition table.
+
+  usage: test_search.py [positions file]
+"""
+
+from benchutil import *
+from copy import deepcopy
+
+
+def search(state, **kwargs):
+	" Return the moves chosen for state, and the number of nodes searched "
+	player = ComputerPlayer(**kwargs)
+	moves = [player.play_card(deepcopy(state))] + player.play_queue
+	return map(unicode, moves), player.node_count
+
+
+if __name__ == "__main__":
+	filename = (sys.argv[1:] or [os.path.join(os.path.dirname(__file__), 'positions.json')])[0]
+	positions = load_positions(filename)
+
+	failed = 0
+	total_full = total_pruned = 0
+	for i, state in enumerate(positions):
+		full_moves, full_nodes = search(state, prune=False)
+		pruned_moves, pruned_nodes = search(state)
+		total_full += full_nodes
+		total_pruned += pruned_nodes
+		same = full_moves == pruned_moves
+		failed += not same
+		print "%3d: %8d nodes, %8d pruned %s" % (i, full_nodes, pruned_nodes,
+				same and 'ok' or 'DIFFERENT %s != %s' % (full_moves, pruned_moves))
+
+	print
+	print "%d of %d positions chose different moves" % (failed, len(positions))
+	print "Nodes: %d full, %d pruned, %.1f%% fewer" % (total_full, total_pruned,
+			100.0 * (total_full - total_pruned) / max(total_full, 1))
+	sys.exit(failed and 1 or 0)
@@ -0,0 +1,39 @@
+"""
+  Regression test for headless games. Plays games whose player is left with
+  no legal move, once the stock has run out and their hand is empty, and
+  checks they end unfinished instead of crashing.
+
+  usage: test_simulate.py [seed ...]
+"""
+
+from benchutil import *
+import logging
+import simulate
+
+# seeds of games that get stuck, at move 184 and 202
+STUCK_SEEDS = [7, 9]
+
+
+if __name__ == "__main__":
+	logging.basicConfig()
+	logging.getLogger('snm.agent').setLevel(logging.ERROR)
+	logging.getLogger('snm.controller').setLevel(logging.ERROR)
+	seeds = map(int, sys.argv[1:]) or STUCK_SEEDS
+
+	failed = 0
+	for seed in seeds:
+		try:
+			game = simulate.play_game((0, seed, ('computer', 'computer'), 2000))
+		except Exception, error:
+			failed += 1
+			print "seed %d: FAILED %r" % (seed, error)
+			continue
+		ok = game['winner'] is None and game['moves'] < 2000
+		failed += not ok
+		print "seed %d: winner %s after %d moves %s" % (seed, game['winner'],
+				game['moves'], ok and 'ok' or 'EXPECTED UNFINISHED')
+
+	# a stuck game used to abort the whole pool
+	summary, games = simulate.simulate(len(seeds), seed=seeds[0], processes=2)
+	print "%d games in 2 processes, %d unfinished" % (summary['games'], summary['unfinished'])
+	sys.exit(failed and 1 or 0)